@@ -0,0 +1,386 @@
+import argparse
+import contextlib
+import glob
+import importlib
+import io
+import json
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from utils.conversion_cache import ConversionCache
+from utils.instrumentation import Recorder
+
+CONVERTER_FOR_SUFFIX = {
+    ".pdf": "pdf",
+    ".docx": "doc",
+    ".pptx": "ppt",
+    ".doc": "tika",
+    ".ppt": "tika",
+    ".rtf": "tika",
+    ".odt": "tika",
+    ".key": "tika",
+    ".pages": "tika",
+}
+
+MANIFEST_NAME = "manifest.jsonl"
+
+# SIGALRM in the worker stops conversions stuck in Python with a clean record;
+# the parent only kills the pool once the worker had this long to do so
+TIMEOUT_GRACE = 5.0
+
+_cache = None
+
+
+def _glob_root(pattern):
+    """Return the leading directories of `pattern` that have no wildcards."""
+    parts = Path(pattern).parts[:-1]
+    literal_parts = []
+
+    for part in parts:
+        if glob.has_magic(part):
+            break
+
+        literal_parts.append(part)
+
+    return Path(*literal_parts) if literal_parts else Path()
+
+
+def find_inputs(specs):
+    """Expand files, directories and glob patterns into `(path, relative)` pairs.
+
+    `relative` is where the output goes under the output directory: the path
+    below the directory, or below the glob's leading directories without
+    wildcards. Files that two specs would put at the same `relative` are
+    moved under `<spec index>-<spec directory name>/`, so none overwrites
+    another.
+    """
+    inputs = {}
+
+    for index, spec in enumerate(specs):
+        spec_path = Path(spec)
+        root = spec_path if spec_path.is_dir() else _glob_root(spec)
+
+        if spec_path.is_dir():
+            paths = [(p, p.relative_to(spec_path)) for p in spec_path.rglob("*")]
+        else:
+            paths = [(Path(p), Path(p).relative_to(root)) for p in glob.glob(spec)]
+
+        for path, relative in paths:
+            if path.is_file() and path.suffix.lower() in CONVERTER_FOR_SUFFIX:
+                inputs.setdefault(path.resolve(), (index, root, relative))
+
+    spec_indices = {}
+
+    for index, _, relative in inputs.values():
+        spec_indices.setdefault(relative, set()).add(index)
+
+    for path, (index, root, relative) in inputs.items():
+        if len(spec_indices[relative]) > 1:
+            relative = Path(f"{index}-{root.resolve().name}") / relative
+
+        inputs[path] = relative
+
+    if len(set(inputs.values())) < len(inputs):
+        raise ValueError("Input files map to the same output file")
+
+    return sorted(inputs.items())
+
+
+def read_manifest(manifest_path):
+    statuses = {}
+
+    if not manifest_path.exists():
+        return statuses
+
+    for line in manifest_path.read_text().splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            # a partially written last line from an interrupted run
+            continue
+
+        statuses[record["input"]] = record["status"]
+
+    return statuses
+
+
+def convert(input_file, converter, recorder):
+    module = importlib.import_module(f"{converter}.main")
+
+    if converter == "tika":
+        html = module.to_html(input_file, recorder=recorder)
+        cleaned_html = module.clean_html(html, recorder=recorder)
+
+        return module.to_markdown(cleaned_html, recorder=recorder)
+
+    return module.to_markdown(input_file=input_file, recorder=recorder)
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError("conversion timed out")
+
+
+def _init_worker(cache_dir):
+    global _cache
+
+    # the parent handles Ctrl-C; running conversions finish first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGALRM, _raise_timeout)
+
+    if cache_dir is not None:
+        _cache = ConversionCache(cache_dir)
+
+
+def _record(input_file):
+    return {
+        "input": str(input_file),
+        "converter": CONVERTER_FOR_SUFFIX[input_file.suffix.lower()],
+    }
+
+
+def convert_file(job):
+    input_file, output_file, timeout = job
+    record = _record(input_file)
+    converter = record["converter"]
+    recorder = Recorder()
+    start = time.perf_counter()
+
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        module = importlib.import_module(f"{converter}.main")
+
+        # converters pprint their skip counters; keep batch output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            if _cache is None:
+                markdown = convert(input_file, converter, recorder)
+            else:
+                markdown = _cache.markdown(
+                    input_file,
+                    converter=converter,
+                    version=module.CONVERTER_VERSION,
+                    convert=lambda: convert(input_file, converter, recorder),
+                )
+
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        output_file.write_text(markdown)
+
+        record.update(status="done", output=str(output_file))
+    except Exception as e:
+        record.update(status="failed", error=f"{type(e).__name__}: {e}")
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    record["metrics"] = recorder.to_dict()
+
+    return record
+
+
+def _failed(job, error, seconds=0.0):
+    record = _record(job[0])
+    record.update(
+        status="failed",
+        error=error,
+        seconds=round(seconds, 3),
+        metrics=Recorder().to_dict(),
+    )
+
+    return record
+
+
+def _worker_died(job):
+    return _failed(job, "BrokenProcessPool: the worker process died")
+
+
+def _timed_out(job, seconds):
+    return _failed(job, "TimeoutError: conversion timed out", seconds)
+
+
+def _terminate_workers(executor):
+    # SIGALRM can't interrupt a conversion stuck in C (MuPDF, lxml), so a job
+    # past its deadline takes the pool down and the executor marks it broken
+    for process in list(executor._processes.values()):
+        process.terminate()
+
+
+def run_jobs(jobs, workers, cache_dir=None):
+    """Yield the manifest record of each job as it finishes.
+
+    At most `workers` jobs are in flight. A worker that dies (a MuPDF
+    segfault, an OOM kill) breaks the whole pool and every job in flight
+    with it, so those jobs are run again one at a time, each on its own
+    pool, to find the one that killed it, while the rest go on in a fresh
+    pool.
+
+    A job still running `TIMEOUT_GRACE` seconds past its timeout is recorded
+    as failed and its pool is terminated; the other jobs in flight are not
+    to blame and go back to the front of the queue.
+    """
+    workers = workers or os.cpu_count() or 1
+    queue = deque(jobs)
+    suspects = []
+
+    while len(queue) > 0:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(cache_dir,)
+        ) as executor:
+            in_flight = {}
+            deadlines = {}
+            broken = False
+
+            while len(in_flight) > 0 or (len(queue) > 0 and not broken):
+                while not broken and len(queue) > 0 and len(in_flight) < workers:
+                    job = queue.popleft()
+                    future = executor.submit(convert_file, job)
+                    in_flight[future] = job
+                    deadlines[future] = time.monotonic() + job[2] + TIMEOUT_GRACE
+
+                done, _ = wait(
+                    in_flight,
+                    timeout=max(0.0, min(deadlines.values()) - time.monotonic()),
+                    return_when=FIRST_COMPLETED,
+                )
+
+                for future in done:
+                    job = in_flight.pop(future)
+                    del deadlines[future]
+
+                    try:
+                        yield future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        suspects.append(job)
+
+                now = time.monotonic()
+                overdue = [f for f, deadline in deadlines.items() if deadline <= now]
+
+                if len(overdue) == 0:
+                    continue
+
+                for future in overdue:
+                    job = in_flight.pop(future)
+                    del deadlines[future]
+                    yield _timed_out(job, job[2] + TIMEOUT_GRACE)
+
+                queue.extendleft(reversed(list(in_flight.values())))
+                in_flight.clear()
+                deadlines.clear()
+                broken = True
+                _terminate_workers(executor)
+
+    for job in suspects:
+        with ProcessPoolExecutor(
+            max_workers=1, initializer=_init_worker, initargs=(cache_dir,)
+        ) as executor:
+            future = executor.submit(convert_file, job)
+
+            try:
+                yield future.result(timeout=job[2] + TIMEOUT_GRACE)
+            except BrokenProcessPool:
+                yield _worker_died(job)
+            except TimeoutError:
+                _terminate_workers(executor)
+                yield _timed_out(job, job[2] + TIMEOUT_GRACE)
+
+
+def convert_all(
+    input_specs,
+    output_dir,
+    workers=None,
+    timeout=600,
+    retry_failed=False,
+    cache_dir=None,
+    metrics_textfile=None,
+):
+    """Convert every matching input on a process pool, resuming from the manifest.
+
+    Each finished file, converted or failed, is appended to `manifest.jsonl` in
+    `output_dir` as soon as it completes, so rerunning the same command after
+    an interruption only converts what is left. Per-file stage timings and
+    counts go into each manifest record; `metrics_textfile` also gets the
+    run's totals in Prometheus textfile format.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+
+    statuses = read_manifest(manifest_path)
+    skip_statuses = {"done"} if retry_failed else {"done", "failed"}
+
+    jobs = [
+        (input_file, output_dir / relative.with_name(f"{relative.name}.md"), timeout)
+        for input_file, relative in find_inputs(input_specs)
+        if statuses.get(str(input_file)) not in skip_statuses
+    ]
+
+    counts = {"done": 0, "failed": 0}
+    totals = Recorder()
+
+    with manifest_path.open("a") as manifest:
+        for record in run_jobs(jobs, workers, cache_dir=cache_dir):
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+
+            counts[record["status"]] += 1
+            totals.merge(Recorder.from_dict(record["metrics"]))
+            totals.count(f"batch.{record['status']}")
+            print(
+                f"[{sum(counts.values())}/{len(jobs)}] {record['status']} "
+                f"{record['input']} ({record['seconds']}s)"
+            )
+
+    if metrics_textfile is not None:
+        totals.write_prometheus(metrics_textfile)
+
+    return counts
+
+
+def _main():
+    parser = argparse.ArgumentParser(
+        description="Convert documents to Markdown in bulk, resuming from a manifest."
+    )
+    parser.add_argument("inputs", nargs="+", help="files, directories or globs")
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=Path(__file__).parents[2] / "output" / "batch",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--timeout", type=float, default=600, help="seconds allowed per file"
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="convert files the manifest records as failed again",
+    )
+    parser.add_argument("--cache-dir", type=Path, default=None)
+    parser.add_argument(
+        "--metrics-textfile",
+        type=Path,
+        default=None,
+        help="write run totals here in Prometheus textfile format",
+    )
+    args = parser.parse_args()
+
+    counts = convert_all(
+        args.inputs,
+        output_dir=args.output_dir,
+        workers=args.workers,
+        timeout=args.timeout,
+        retry_failed=args.retry_failed,
+        cache_dir=args.cache_dir,
+        metrics_textfile=args.metrics_textfile,
+    )
+
+    print(counts)
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,402 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import partial
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Callable
+
+
+def _count_pdf_pages(input_file):
+    import fitz
+
+    with fitz.open(input_file) as doc:
+        return doc.page_count
+
+
+def _load_pdf(input_file):
+    importlib.import_module("pdf.main")
+
+    return input_file
+
+
+def _pdf_to_markdown(input_file, profile="standard"):
+    from pdf import main as pdf_main
+
+    pdf_main.to_markdown(input_file=input_file, profile=profile)
+
+
+def _pdf_parse_page(input_file):
+    from collections import Counter
+
+    import fitz
+    from pdf import main as pdf_main
+
+    skip_counter = Counter()
+
+    with fitz.open(input_file) as doc:
+        for page in doc.pages():
+            pdf_main.parse_page(page, skip_counter)
+
+
+def _count_slides(input_file):
+    from pptx import Presentation
+
+    return len(Presentation(input_file).slides)
+
+
+def _load_ppt(input_file):
+    importlib.import_module("ppt.main")
+
+    return input_file
+
+
+def _ppt_to_markdown(input_file):
+    from ppt import main as ppt_main
+
+    ppt_main.to_markdown(input_file=input_file)
+
+
+def _count_ppt_tables(input_file):
+    return len(_load_ppt_tables(input_file))
+
+
+def _load_ppt_tables(input_file):
+    from pptx import Presentation
+
+    importlib.import_module("ppt.main")
+
+    return [
+        shape.table
+        for slide in Presentation(input_file).slides
+        for shape in slide.shapes
+        if shape.has_table
+    ]
+
+
+def _ppt_table_to_markdown(tables):
+    from ppt import main as ppt_main
+
+    for table in tables:
+        ppt_main.table_to_markdown(table)
+
+
+def _count_paragraphs(input_file):
+    from docx import Document
+
+    return len(Document(input_file).paragraphs)
+
+
+def _load_doc(input_file):
+    importlib.import_module("doc.main")
+
+    return input_file
+
+
+def _doc_to_markdown(input_file, engine="python-docx"):
+    from doc import main as doc_main
+
+    doc_main.to_markdown(input_file=input_file, engine=engine)
+
+
+def _count_document(input_file):
+    return 1
+
+
+def _load_tika_html(input_file):
+    from tika import main as tika_main
+
+    return tika_main.to_html(input_file)
+
+
+def _tika_clean_html(html):
+    from tika import main as tika_main
+
+    tika_main.clean_html(html)
+
+
+@dataclass
+class Benchmark:
+    """One timed operation over one kind of input.
+
+    `count(input_file)` returns the number of units and runs in the parent
+    process, so loading a whole document to count its paragraphs does not
+    show in the measured peak RSS. `load(input_file)` runs in the measuring
+    process outside the timed region and returns the payload; it also
+    imports the converter so import time is not measured. `run(payload)` is
+    the timed part.
+    """
+
+    suffixes: tuple
+    unit: str
+    count: Callable
+    load: Callable
+    run: Callable
+
+
+BENCHMARKS = {
+    "pdf.parse_page": Benchmark(
+        (".pdf",), "pages", _count_pdf_pages, _load_pdf, _pdf_parse_page
+    ),
+    **{
+        f"pdf.to_markdown[{profile}]": Benchmark(
+            (".pdf",),
+            "pages",
+            _count_pdf_pages,
+            _load_pdf,
+            partial(_pdf_to_markdown, profile=profile),
+        )
+        for profile in ["fast", "standard", "rich"]
+    },
+    "ppt.to_markdown": Benchmark(
+        (".pptx",), "slides", _count_slides, _load_ppt, _ppt_to_markdown
+    ),
+    "ppt.table_to_markdown": Benchmark(
+        (".pptx",),
+        "tables",
+        _count_ppt_tables,
+        _load_ppt_tables,
+        _ppt_table_to_markdown,
+    ),
+    "doc.to_markdown": Benchmark(
+        (".docx",), "paragraphs", _count_paragraphs, _load_doc, _doc_to_markdown
+    ),
+    "doc.to_markdown[stream]": Benchmark(
+        (".docx",),
+        "paragraphs",
+        _count_paragraphs,
+        _load_doc,
+        partial(_doc_to_markdown, engine="stream"),
+    ),
+    "tika.clean_html": Benchmark(
+        (".pdf", ".docx", ".pptx"),
+        "documents",
+        _count_document,
+        _load_tika_html,
+        _tika_clean_html,
+    ),
+}
+
+
+def _reset_peak_rss():
+    # Linux only: resets VmHWM to the current RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb():
+    """Return the peak RSS of this process since `_reset_peak_rss`, in MB.
+
+    ru_maxrss is not used where /proc is available, as it survives exec and
+    so includes the parent the process was spawned from.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _measure(benchmark_name, input_file):
+    benchmark = BENCHMARKS[benchmark_name]
+    payload = benchmark.load(input_file)
+
+    _reset_peak_rss()
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    # converters pprint their skip counters
+    with contextlib.redirect_stdout(io.StringIO()):
+        benchmark.run(payload)
+
+    wall_seconds = time.perf_counter() - wall_start
+    cpu_seconds = time.process_time() - cpu_start
+
+    peak_rss_mb = _peak_rss_mb()
+
+    return {
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": cpu_seconds,
+        "peak_rss_mb": peak_rss_mb,
+    }
+
+
+def measure(benchmark_name, input_file, repeat=3):
+    """Run one benchmark `repeat` times, each in a fresh process, keeping the best.
+
+    A fresh spawned process per run keeps peak RSS specific to the run rather
+    than to whatever ran before it. Peak RSS covers the timed region, on top
+    of the imports and the loaded payload.
+    """
+    benchmark = BENCHMARKS[benchmark_name]
+    units = benchmark.count(input_file)
+    runs = []
+
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as e:
+            runs.append(e.submit(_measure, benchmark_name, input_file).result())
+
+    best = min(runs, key=lambda run: run["wall_seconds"])
+    wall_seconds = best["wall_seconds"]
+
+    return {
+        "units": units,
+        "unit": benchmark.unit,
+        **best,
+        "units_per_second": units / wall_seconds if wall_seconds > 0 else None,
+        "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+        "repeat": repeat,
+    }
+
+
+def run_suite(data_dir, benchmark_names=None, repeat=3):
+    if benchmark_names is None:
+        benchmark_names = list(BENCHMARKS)
+
+    results = {}
+
+    for benchmark_name in benchmark_names:
+        benchmark = BENCHMARKS[benchmark_name]
+
+        for input_file in sorted(Path(data_dir).iterdir()):
+            if input_file.suffix.lower() not in benchmark.suffixes:
+                continue
+
+            case = f"{benchmark_name}:{input_file.name}"
+
+            try:
+                results[case] = measure(benchmark_name, input_file, repeat=repeat)
+            except Exception as e:
+                results[case] = {"error": f"{type(e).__name__}: {e}"}
+
+            print(case, _format_result(results[case]))
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "machine": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=0.1):
+    """Return the cases in `current` that are slower or bigger than `baseline`.
+
+    A case regresses when its wall time or peak RSS grows by more than
+    `threshold` (a fraction of the baseline value).
+    """
+    regressions = []
+
+    for case, result in current["results"].items():
+        baseline_result = baseline["results"].get(case)
+
+        if baseline_result is None or "error" in result or "error" in baseline_result:
+            continue
+
+        for metric in ["wall_seconds", "peak_rss_mb"]:
+            before = baseline_result[metric]
+            after = result[metric]
+
+            if before > 0 and after > before * (1 + threshold):
+                regressions.append(
+                    {
+                        "case": case,
+                        "metric": metric,
+                        "baseline": before,
+                        "current": after,
+                        "change": after / before - 1,
+                    }
+                )
+
+    return regressions
+
+
+def _format_result(result):
+    if "error" in result:
+        return f"error {result['error']}"
+
+    return (
+        f"{result['units_per_second']:.1f} {result['unit']}/s "
+        f"wall {result['wall_seconds']:.3f}s cpu {result['cpu_seconds']:.3f}s "
+        f"peak {result['peak_rss_mb']:.0f}MB"
+    )
+
+
+def _main():
+    base_dir = Path(__file__).parents[2]
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the converters over the data/ corpus."
+    )
+    parser.add_argument("--data-dir", type=Path, default=base_dir / "data")
+    parser.add_argument(
+        "--benchmark",
+        action="append",
+        choices=list(BENCHMARKS),
+        help="benchmark to run, may be repeated (default: all)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=base_dir
+        / "output"
+        / "bench"
+        / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json",
+        help="where to save the results as a JSON baseline",
+    )
+    parser.add_argument(
+        "--compare", type=Path, help="earlier baseline to check for regressions"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="allowed growth in wall time or peak RSS before flagging",
+    )
+    args = parser.parse_args()
+
+    current = run_suite(args.data_dir, args.benchmark, repeat=args.repeat)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(current, indent=2))
+    print(f"saved {args.output}")
+
+    if args.compare is None:
+        return
+
+    regressions = compare(
+        json.loads(args.compare.read_text()), current, threshold=args.threshold
+    )
+
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression['case']} {regression['metric']} "
+            f"{regression['baseline']:.3f} -> {regression['current']:.3f} "
+            f"({regression['change']:+.0%})"
+        )
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    _main()
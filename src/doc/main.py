@@ -1,25 +1,50 @@
+import io
 from collections import Counter
 from pathlib import Path
 from pprint import pprint
 
 from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.table import Table
 from docx.text.hyperlink import Hyperlink
 from docx.text.run import Run
 
+from doc import stream
+from doc.ooxml import (
+    HeaderFooterWriter,
+    header_footer_references,
+    paragraph_style_id,
+    resolve_reference,
+    run_style_id,
+    table_to_markdown,
+)
+from doc.numbering import ListCounters, NumberingTable
+from doc.styles import StyleTable
 from utils import text_skipping
-
-
-def header_footer_to_markdown(header_footer, style_to_prefix):
-    lines = []
-    for paragraph in header_footer.paragraphs:
-        if len(paragraph.text.strip()) == 0:
-            continue
-        lines.append(f"{style_to_prefix[paragraph.style.name]}{paragraph.text}")
-
-    return lines
-
-
-def paragraph_to_markdown(document):
+from utils.conversion_cache import ConversionCache
+from utils.instrumentation import NULL_RECORDER
+from utils.markdown_writer import MarkdownWriter
+
+CONVERTER_VERSION = "2"
+
+# prefixes by style name, over the heading levels from the styles' outline levels
+STYLE_TO_PREFIX = {
+    "title": "# ",
+    "body": "",
+    "Attribution": "# ",
+    "Subheading": "## ",
+    "Title 2": "### ",
+    "Body": "",
+    "Heading": "# ",
+    "Header & Footer": "### ",
+}
+
+# "python-docx" builds the whole object model, "stream" parses document.xml
+# incrementally (see doc.stream)
+ENGINES = ("python-docx", "stream")
+
+
+def paragraph_to_markdown(document, style_table):
     lines = []
 
     for i, paragraph in enumerate(document.paragraphs):
@@ -27,14 +52,16 @@ def paragraph_to_markdown(document):
         for content in paragraph.iter_inner_content():
             font_sizes = []
             if isinstance(content, Run):
-                font_size = content.style.font.size
-                font_sizes.append(font_size)
-
+                runs = [content._r]
             elif isinstance(content, Hyperlink):
-                font_size = content.style.font.size
+                runs = content._hyperlink.r_lst
             else:
                 assert False
 
+            for run in runs:
+                font_size = style_table.get(run_style_id(run), "character").size
+                font_sizes.append(font_size)
+
             if len(content.text.strip()) == 0:
                 continue
 
@@ -43,62 +70,169 @@ def paragraph_to_markdown(document):
         if len(paragraph.text.strip()) == 0:
             continue
 
-        font_size = paragraph.style.font.size
+        font_size = style_table.get(paragraph_style_id(paragraph._p)).size
         lines.append(paragraph.text)
 
     return lines
 
 
-def to_markdown(input_file):
-    document = Document(input_file)
+def write_markdown(
+    input_file,
+    output,
+    skip_counter,
+    recorder=NULL_RECORDER,
+    engine="python-docx",
+    header_footer="always",
+):
+    """Write the Markdown for `input_file` to `output` section by section.
+
+    `output` is a text stream or a `MarkdownWriter`. `engine` is one of
+    `ENGINES`; both produce the same output. `header_footer` is one of
+    `HEADER_FOOTER_POLICIES` and decides which section headers and footers
+    are written.
+    """
+    writer = output
+
+    if not isinstance(writer, MarkdownWriter):
+        writer = MarkdownWriter(output, separator="\n\n")
+
+    if engine == "stream":
+        stream.write_markdown(
+            input_file,
+            writer,
+            skip_counter,
+            STYLE_TO_PREFIX,
+            recorder=recorder,
+            header_footer=header_footer,
+        )
+        writer.flush()
+        recorder.count("doc.lines", writer.blocks)
+        return
+
+    if engine != "python-docx":
+        raise ValueError(f"Unknown engine: {engine}")
+
+    with recorder.stage("doc.load"):
+        document = Document(input_file)
+
+    # resolve every style once; paragraphs then only look up their style id
+    style_table = StyleTable(document.styles.element, overrides=STYLE_TO_PREFIX)
+
+    # the same for the list levels; counters then number the list items
+    try:
+        numbering_element = document.part.part_related_by(RT.NUMBERING).element
+    except KeyError:
+        numbering_element = None
+
+    list_counters = ListCounters(NumberingTable(numbering_element), style_table)
+
+    # headers and footers by part, as linked sections share their part
+    sections = document.sections
+    references = [header_footer_references(section._sectPr) for section in sections]
+    parts = {str(part.partname): part for part in document.part.related_parts.values()}
+
+    header_footer_writer = HeaderFooterWriter(
+        writer,
+        style_table,
+        lambda part_name: parts[part_name].element,
+        policy=header_footer,
+    )
 
-    lines = []
-    style_to_prefix = {
-        "title": "# ",
-        "body": "",
-        "Attribution": "# ",
-        "Subheading": "## ",
-        "Title 2": "### ",
-        "Body": "",
-        "Heading": "# ",
-        "Header & Footer": "### ",
-    }
+    def write_header_footer(section_index, kind):
+        rId = resolve_reference(references, section_index, kind)
 
-    skip_counter = Counter()
+        if rId is not None:
+            part_name = str(document.part.related_parts[rId].partname)
+            header_footer_writer.write(kind, part_name)
 
-    for i, section in enumerate(document.sections):
-        # lines.append(f"# SECTION {i+1}")
+    for i, section in enumerate(sections):
+        # writer.write(f"# SECTION {i+1}")
 
-        lines += header_footer_to_markdown(section.header, style_to_prefix)
+        with recorder.stage("doc.header_footer"):
+            write_header_footer(i, "header")
 
-        for section_inner in section.iter_inner_content():
-            if len(section_inner.text.strip()) == 0:
-                continue
+        with recorder.stage("doc.body"):
+            for section_inner in section.iter_inner_content():
+                recorder.count("doc.blocks")
 
-            text = section_inner.text.replace("\n", " ")
+                if isinstance(section_inner, Table):
+                    # built from the w:tbl element, not row.cells, which
+                    # rebuilds the cell grid on every access
+                    with recorder.stage("doc.table_to_markdown"):
+                        table = table_to_markdown(section_inner._tbl)
 
-            if text_skipping.should_skip(text):
-                skip_counter[text] += 1
-                continue
+                    if table is not None:
+                        writer.write(table)
+                        recorder.count("doc.tables")
 
-            lines.append(f"{style_to_prefix[section_inner.style.name]}{text}")
+                    continue
 
-        lines += header_footer_to_markdown(section.footer, style_to_prefix)
+                marker = list_counters.marker(section_inner._p)
+
+                if len(section_inner.text.strip()) == 0:
+                    continue
+
+                text = section_inner.text.replace("\n", " ")
+
+                if text_skipping.should_skip(text):
+                    skip_counter[text] += 1
+                    continue
+
+                style_id = paragraph_style_id(section_inner._p)
+                # headings keep their heading prefix, even when numbered
+                prefix = style_table.prefix(style_id) or marker
+                writer.write(f"{prefix}{text}")
+
+        with recorder.stage("doc.header_footer"):
+            write_header_footer(i, "footer")
+
+        recorder.count("doc.sections")
 
     should_use_paragraphs = False
 
     if should_use_paragraphs:
-        lines += paragraph_to_markdown(document)
+        for line in paragraph_to_markdown(document, style_table):
+            writer.write(line)
+
+    writer.flush()
+
+    recorder.count("doc.lines", writer.blocks)
+
+
+def to_markdown(
+    input_file, recorder=NULL_RECORDER, engine="python-docx", header_footer="always"
+):
+    skip_counter = Counter()
+
+    output = io.StringIO()
+
+    write_markdown(
+        input_file,
+        output,
+        skip_counter,
+        recorder=recorder,
+        engine=engine,
+        header_footer=header_footer,
+    )
+
+    recorder.count("doc.skipped", sum(skip_counter.values()))
 
     pprint(skip_counter)
 
-    return "\n\n".join(lines)
+    return output.getvalue()
 
 
 def _main():
     data_dir = Path(__file__).parents[2] / "data"
     input_filename = data_dir / "sample.docx"
-    output = to_markdown(input_file=input_filename)
+
+    cache = ConversionCache(Path(__file__).parents[2] / "output" / "cache")
+    output = cache.markdown(
+        input_filename,
+        converter="doc",
+        version=CONVERTER_VERSION,
+        convert=lambda: to_markdown(input_file=input_filename),
+    )
 
     output_dir = (
         Path(__file__).parents[2] / "output" / "doc" / f"{input_filename.name}.md"
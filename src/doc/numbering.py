@@ -0,0 +1,147 @@
+from dataclasses import dataclass
+
+from doc.ooxml import (
+    W_PPR,
+    W_VAL,
+    _int_val,
+    _w,
+    numbering_properties,
+    paragraph_style_id,
+)
+
+# numFmt values without a visible marker; every other format is ordered
+UNORDERED_FORMATS = {"bullet", "none"}
+
+# Markdown nests list items by the content column of their parent, which is
+# at most 4 for "- " and "1. " to "99. "
+LIST_INDENT = "    "
+
+
+@dataclass(slots=True)
+class ListLevel:
+    """One level of a list definition (w:lvl)."""
+
+    # w:numFmt: bullet, decimal, lowerLetter, upperRoman, none, ...
+    format: str = "bullet"
+    start: int = 0
+
+    @property
+    def ordered(self):
+        return self.format not in UNORDERED_FORMATS
+
+
+def _list_level(lvl, start=None):
+    num_fmt = lvl.find(_w("numFmt"))
+
+    return ListLevel(
+        format="decimal" if num_fmt is None else num_fmt.get(W_VAL),
+        start=_int_val(lvl, "start", 0) if start is None else start,
+    )
+
+
+class NumberingTable:
+    """Every list level of a numbering.xml, resolved once into `ListLevel`s.
+
+    Built from the w:numbering element (`numbering_part.element` with
+    python-docx, or numbering.xml parsed directly). A w:num points to a
+    w:abstractNum and may override its levels or their start, so the levels
+    are keyed by `(numId, ilvl)` and a list paragraph only needs a dict
+    lookup.
+    """
+
+    def __init__(self, numbering_element=None):
+        self.levels = {}
+
+        if numbering_element is None:
+            return
+
+        abstract_levels = {}
+
+        for abstract_num in numbering_element.iterfind(_w("abstractNum")):
+            abstract_levels[abstract_num.get(_w("abstractNumId"))] = {
+                int(lvl.get(_w("ilvl"))): _list_level(lvl)
+                for lvl in abstract_num.iterfind(_w("lvl"))
+            }
+
+        for num in numbering_element.iterfind(_w("num")):
+            num_id = num.get(_w("numId"))
+            abstract_num_id = num.find(_w("abstractNumId"))
+            levels = dict(
+                abstract_levels.get(
+                    None if abstract_num_id is None else abstract_num_id.get(W_VAL),
+                    {},
+                )
+            )
+
+            for override in num.iterfind(_w("lvlOverride")):
+                ilvl = int(override.get(_w("ilvl")))
+                lvl = override.find(_w("lvl"))
+                start = override.find(_w("startOverride"))
+                start = None if start is None else int(start.get(W_VAL))
+
+                if lvl is not None:
+                    levels[ilvl] = _list_level(lvl, start)
+                elif start is not None and ilvl in levels:
+                    levels[ilvl] = ListLevel(levels[ilvl].format, start)
+
+            for ilvl, level in levels.items():
+                self.levels[(num_id, ilvl)] = level
+
+    def get(self, num_id, ilvl):
+        """Return the `ListLevel` of `ilvl` in list `num_id`, or None."""
+        return self.levels.get((num_id, ilvl))
+
+
+class ListCounters:
+    """Running item numbers of the lists of one document.
+
+    Counters are kept per list (numId) and level, and continue across
+    paragraphs that are not list items, as in Word. An item resets the
+    counters of the deeper levels of its list. Paragraphs take their numbering
+    from their own w:numPr or else from their paragraph style.
+    """
+
+    def __init__(self, numbering_table, style_table):
+        self.numbering_table = numbering_table
+        self.style_table = style_table
+        self._counters = {}
+
+    def marker(self, paragraph):
+        """Return the Markdown list marker of a w:p element, "" if not a list item.
+
+        Call it for every paragraph in document order, including empty ones,
+        as they advance the counters too.
+        """
+        num_id, ilvl = numbering_properties(paragraph.find(W_PPR))
+
+        if num_id is None or ilvl is None:
+            style = self.style_table.get(paragraph_style_id(paragraph))
+
+            if num_id is None:
+                num_id = style.num_id
+
+            if ilvl is None:
+                ilvl = style.list_level or 0
+
+        # numId 0 removes the numbering of the paragraph style
+        if num_id is None or num_id == "0":
+            return ""
+
+        level = self.numbering_table.get(num_id, ilvl)
+
+        if level is None or level.format == "none":
+            return ""
+
+        counters = self._counters.setdefault(num_id, {})
+
+        for deeper in [i for i in counters if i > ilvl]:
+            del counters[deeper]
+
+        counters[ilvl] = counters.get(ilvl, level.start - 1) + 1
+
+        indent = LIST_INDENT * ilvl
+
+        if level.ordered:
+            return f"{indent}{counters[ilvl]}. "
+
+        return f"{indent}- "
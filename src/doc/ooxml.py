@@ -0,0 +1,248 @@
+"""Readers for WordprocessingML elements, shared by both DOCX engines."""
+
+from utils.tables import rows_to_markdown
+
+W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+
+def _w(tag):
+    return f"{{{W}}}{tag}"
+
+
+W_BODY = _w("body")
+W_P = _w("p")
+W_PPR = _w("pPr")
+W_R = _w("r")
+W_T = _w("t")
+W_BR = _w("br")
+W_HYPERLINK = _w("hyperlink")
+W_TBL = _w("tbl")
+W_TR = _w("tr")
+W_TC = _w("tc")
+W_SECTPR = _w("sectPr")
+W_VAL = _w("val")
+W_TYPE = _w("type")
+R_ID = f"{{{R}}}id"
+
+# text of the run children other than w:t and w:br, as python-docx reads them
+RUN_TEXT = {
+    _w("tab"): "\t",
+    _w("ptab"): "\t",
+    _w("cr"): "\n",
+    _w("noBreakHyphen"): "-",
+}
+
+
+def run_text(run):
+    parts = []
+
+    for child in run:
+        if child.tag == W_T:
+            parts.append(child.text or "")
+        elif child.tag == W_BR:
+            # page and column breaks have no text
+            if child.get(W_TYPE, "textWrapping") == "textWrapping":
+                parts.append("\n")
+        else:
+            parts.append(RUN_TEXT.get(child.tag, ""))
+
+    return "".join(parts)
+
+
+def paragraph_text(paragraph):
+    """Return the text of a w:p element, as `Paragraph.text` does."""
+    parts = []
+
+    for child in paragraph:
+        if child.tag == W_R:
+            parts.append(run_text(child))
+        elif child.tag == W_HYPERLINK:
+            parts += [run_text(run) for run in child.iterfind(W_R)]
+
+    return "".join(parts)
+
+
+def paragraph_style_id(paragraph):
+    """Return the style id of a w:p element, None for the default style."""
+    pPr = paragraph.find(W_PPR)
+
+    if pPr is None:
+        return None
+
+    pStyle = pPr.find(_w("pStyle"))
+
+    return None if pStyle is None else pStyle.get(W_VAL)
+
+
+def run_style_id(run):
+    """Return the style id of a w:r element, None for the default style."""
+    rPr = run.find(_w("rPr"))
+
+    if rPr is None:
+        return None
+
+    rStyle = rPr.find(_w("rStyle"))
+
+    return None if rStyle is None else rStyle.get(W_VAL)
+
+
+def numbering_properties(pPr):
+    """Return the (numId, ilvl) of a w:pPr, None for the ones not set."""
+    num_pr = None if pPr is None else pPr.find(_w("numPr"))
+
+    if num_pr is None:
+        return None, None
+
+    num_id = num_pr.find(_w("numId"))
+    num_id = None if num_id is None else num_id.get(W_VAL)
+    ilvl = num_pr.find(_w("ilvl"))
+    ilvl = None if ilvl is None else int(ilvl.get(W_VAL))
+
+    return num_id, ilvl
+
+
+def _int_val(parent, tag, default):
+    if parent is None:
+        return default
+
+    element = parent.find(_w(tag))
+
+    return default if element is None else int(element.get(W_VAL))
+
+
+def table_rows(table):
+    """Return the cell texts of a w:tbl element as a grid, in one pass.
+
+    A cell spanning columns (gridSpan) repeats its text in each of them, and
+    a vertically merged cell (vMerge continue) repeats the text above, like
+    `row.cells` in python-docx. Columns skipped with gridBefore are empty.
+    Cell text is its paragraphs joined by newlines, as `_Cell.text`.
+    """
+    rows = []
+
+    for tr in table.iterfind(W_TR):
+        row = [""] * _int_val(tr.find(_w("trPr")), "gridBefore", 0)
+
+        for tc in tr.iterfind(W_TC):
+            tcPr = tc.find(_w("tcPr"))
+            span = _int_val(tcPr, "gridSpan", 1)
+            v_merge = None if tcPr is None else tcPr.find(_w("vMerge"))
+            column = len(row)
+
+            if (
+                v_merge is not None
+                and v_merge.get(W_VAL, "continue") == "continue"
+                and len(rows) > 0
+                and column < len(rows[-1])
+            ):
+                text = rows[-1][column]
+            else:
+                text = "\n".join([paragraph_text(p) for p in tc.iterfind(W_P)])
+
+            row += [text] * span
+
+        rows.append(row)
+
+    return rows
+
+
+def table_to_markdown(table):
+    """Return a w:tbl element as a Markdown table, its first row as header.
+
+    Returns None for a table without any text.
+    """
+    rows = table_rows(table)
+
+    if not any(cell.strip() for row in rows for cell in row):
+        return None
+
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+
+    return rows_to_markdown(rows[0], rows[1:])
+
+
+def header_footer_references(sectPr):
+    """Return the rIds of the default header and footer of a section."""
+    references = {}
+
+    for kind in ("header", "footer"):
+        for reference in sectPr.iterfind(_w(f"{kind}Reference")):
+            if reference.get(W_TYPE) == "default":
+                references[kind] = reference.get(R_ID)
+
+    return references
+
+
+def resolve_reference(sections, section_index, kind):
+    """Return the rId of the `kind` part shown in a section, or None.
+
+    `sections` holds the `header_footer_references` of every section. A
+    section without its own header or footer shows the previous one.
+    """
+    for references in reversed(sections[: section_index + 1]):
+        if kind in references:
+            return references[kind]
+
+    return None
+
+
+# "always" writes the header and footer of every section, "once" each
+# distinct part once per document, "on_change" a part when it differs from
+# the previous section's and "never" none at all
+HEADER_FOOTER_POLICIES = ("always", "once", "on_change", "never")
+
+
+class HeaderFooterWriter:
+    """Writes section headers and footers, converting each part only once.
+
+    Sections that link to a previous header share its part, so parts are
+    keyed by part name. `load_part(part_name)` returns the w:hdr or w:ftr
+    element of a part that is not converted yet.
+    """
+
+    def __init__(self, writer, style_table, load_part, policy="always"):
+        if policy not in HEADER_FOOTER_POLICIES:
+            raise ValueError(f"Unknown header/footer policy: {policy}")
+
+        self.writer = writer
+        self.style_table = style_table
+        self.load_part = load_part
+        self.policy = policy
+        self._lines = {}
+        self._written = set()
+        self._previous = {}
+
+    def lines(self, part_name):
+        if part_name not in self._lines:
+            lines = []
+
+            for paragraph in self.load_part(part_name).iterfind(W_P):
+                text = paragraph_text(paragraph)
+
+                if len(text.strip()) == 0:
+                    continue
+
+                prefix = self.style_table.prefix(paragraph_style_id(paragraph))
+                lines.append(f"{prefix}{text}")
+
+            self._lines[part_name] = lines
+
+        return self._lines[part_name]
+
+    def write(self, kind, part_name):
+        if part_name is None or self.policy == "never":
+            return
+
+        if self.policy == "once" and part_name in self._written:
+            return
+
+        if self.policy == "on_change" and self._previous.get(kind) == part_name:
+            return
+
+        self._written.add(part_name)
+        self._previous[kind] = part_name
+
+        for line in self.lines(part_name):
+            self.writer.write(line)
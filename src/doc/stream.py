@@ -0,0 +1,225 @@
+import posixpath
+import zipfile
+
+from lxml import etree
+
+from doc.ooxml import (
+    R,
+    W_BODY,
+    W_P,
+    W_PPR,
+    W_SECTPR,
+    W_TBL,
+    HeaderFooterWriter,
+    header_footer_references,
+    paragraph_style_id,
+    paragraph_text,
+    resolve_reference,
+    table_to_markdown,
+)
+from doc.numbering import ListCounters, NumberingTable
+from doc.styles import StyleTable
+from utils import text_skipping
+from utils.instrumentation import NULL_RECORDER
+
+OFFICE_DOCUMENT = f"{R}/officeDocument"
+STYLES = f"{R}/styles"
+NUMBERING = f"{R}/numbering"
+
+
+class Package:
+    """Reads the parts of a DOCX zip by relationship, without python-docx."""
+
+    def __init__(self, input_file):
+        self.zip_file = zipfile.ZipFile(input_file)
+
+        try:
+            self.part_names = set(self.zip_file.namelist())
+            self.document_path = self.related_path("", OFFICE_DOCUMENT)
+        except BaseException:
+            self.zip_file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def rels(self, part_path):
+        """Return `{rId: (type, part path)}` for the internal relationships of a part."""
+        directory, name = posixpath.split(part_path)
+        rels_path = posixpath.join(directory, "_rels", f"{name}.rels")
+
+        if rels_path not in self.part_names:
+            return {}
+
+        rels = {}
+
+        for rel in etree.fromstring(self.zip_file.read(rels_path)):
+            if rel.get("TargetMode") == "External":
+                continue
+
+            target = rel.get("Target")
+
+            if target.startswith("/"):
+                target_path = target[1:]
+            else:
+                target_path = posixpath.normpath(posixpath.join(directory, target))
+
+            rels[rel.get("Id")] = (rel.get("Type"), target_path)
+
+        return rels
+
+    def related_path(self, part_path, rel_type):
+        for target_type, target_path in self.rels(part_path).values():
+            if target_type == rel_type:
+                return target_path
+
+        return None
+
+    def open(self, part_path):
+        return self.zip_file.open(part_path)
+
+    def parse(self, part_path):
+        return etree.fromstring(self.zip_file.read(part_path))
+
+    def close(self):
+        self.zip_file.close()
+
+
+def iter_body_elements(source):
+    """Yield the w:body children of document.xml one at a time.
+
+    Each element is complete when yielded and is cleared afterwards, so the
+    document is never held in memory as a whole.
+    """
+    for _, element in etree.iterparse(source, events=("end",)):
+        parent = element.getparent()
+
+        if parent is None or parent.tag != W_BODY:
+            continue
+
+        yield element
+
+        element.clear()
+
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def _section_sectPr(element):
+    """Return the sectPr ending a section at this body element, if any."""
+    if element.tag == W_SECTPR:
+        return element
+
+    if element.tag == W_P:
+        pPr = element.find(W_PPR)
+
+        if pPr is not None:
+            return pPr.find(W_SECTPR)
+
+    return None
+
+
+def read_sections(package):
+    """Return the header/footer rIds of every section, in document order.
+
+    Sections are defined by their sectPr, which comes after the section
+    content, so this is a quick pass over document.xml before emitting.
+    """
+    with package.open(package.document_path) as source:
+        return [
+            header_footer_references(sectPr)
+            for sectPr in map(_section_sectPr, iter_body_elements(source))
+            if sectPr is not None
+        ]
+
+
+def write_markdown(
+    input_file,
+    writer,
+    skip_counter,
+    style_to_prefix=None,
+    recorder=NULL_RECORDER,
+    header_footer="always",
+):
+    """Write the Markdown for `input_file` to `writer`, streaming document.xml.
+
+    Produces the same output as `doc.main` with python-docx: per section the
+    default header (inherited from earlier sections when not defined), the
+    body paragraphs and the default footer. `style_to_prefix` overrides the
+    heading prefixes by style name, see `StyleTable`. `header_footer` is one
+    of `HEADER_FOOTER_POLICIES`.
+    """
+    with Package(input_file) as package:
+        with recorder.stage("doc.load"):
+            styles_path = package.related_path(package.document_path, STYLES)
+            style_table = StyleTable(
+                package.parse(styles_path) if styles_path else None,
+                overrides=style_to_prefix,
+            )
+            numbering_path = package.related_path(package.document_path, NUMBERING)
+            numbering_table = NumberingTable(
+                package.parse(numbering_path) if numbering_path else None
+            )
+            sections = read_sections(package)
+            rels = package.rels(package.document_path)
+
+        list_counters = ListCounters(numbering_table, style_table)
+
+        def style_prefix(paragraph):
+            return style_table.prefix(paragraph_style_id(paragraph))
+
+        header_footer_writer = HeaderFooterWriter(
+            writer, style_table, package.parse, policy=header_footer
+        )
+
+        def write_header_footer(section_index, kind):
+            rId = resolve_reference(sections, section_index, kind)
+
+            if rId is not None:
+                header_footer_writer.write(kind, rels[rId][1])
+
+        section_index = 0
+
+        with package.open(package.document_path) as source:
+            elements = iter_body_elements(source)
+
+            while section_index < len(sections):
+                with recorder.stage("doc.header_footer"):
+                    write_header_footer(section_index, "header")
+
+                with recorder.stage("doc.body"):
+                    for element in elements:
+                        if element.tag in (W_P, W_TBL):
+                            recorder.count("doc.blocks")
+
+                        if element.tag == W_P:
+                            marker = list_counters.marker(element)
+                            text = paragraph_text(element)
+
+                            if len(text.strip()) > 0:
+                                text = text.replace("\n", " ")
+
+                                if text_skipping.should_skip(text):
+                                    skip_counter[text] += 1
+                                else:
+                                    prefix = style_prefix(element) or marker
+                                    writer.write(f"{prefix}{text}")
+                        elif element.tag == W_TBL:
+                            with recorder.stage("doc.table_to_markdown"):
+                                table = table_to_markdown(element)
+
+                            if table is not None:
+                                writer.write(table)
+                                recorder.count("doc.tables")
+
+                        if _section_sectPr(element) is not None:
+                            break
+
+                with recorder.stage("doc.header_footer"):
+                    write_header_footer(section_index, "footer")
+
+                recorder.count("doc.sections")
+                section_index += 1
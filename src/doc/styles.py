@@ -0,0 +1,200 @@
+from dataclasses import dataclass
+
+from doc.ooxml import W_TYPE, W_VAL, _w, numbering_properties
+
+# the built-in style names python-docx shows differently from styles.xml
+UI_STYLE_NAMES = {
+    "caption": "Caption",
+    "footer": "Footer",
+    "header": "Header",
+    **{f"heading {level}": f"Heading {level}" for level in range(1, 10)},
+}
+
+
+# Markdown has six heading levels; deeper outline levels are body text
+MAX_HEADING_LEVEL = 6
+
+
+def _is_on(value):
+    return value in ("1", "true", "on")
+
+
+@dataclass(slots=True)
+class ResolvedStyle:
+    """A style with its `basedOn` chain and the document defaults applied."""
+
+    name: str = None
+    type: str = "paragraph"
+    # 0-based as in w:outlineLvl; None (or 9) for body text
+    outline_level: int = None
+    bold: bool = False
+    italic: bool = False
+    # in points
+    size: float = None
+    # the list (w:numId) and level of the paragraphs with this style
+    num_id: str = None
+    list_level: int = None
+
+    @property
+    def heading_level(self):
+        if self.outline_level is None or not 0 <= self.outline_level <= 8:
+            return None
+
+        return self.outline_level + 1
+
+
+def _toggle(rPr, tag):
+    element = rPr.find(_w(tag))
+
+    if element is None:
+        return None
+
+    return _is_on(element.get(W_VAL, "true"))
+
+
+def _own_properties(style):
+    """Return the properties a w:style (or w:docDefaults) sets itself."""
+    properties = {}
+
+    pPr = style.find(_w("pPr"))
+
+    if pPr is None:
+        pPr = style.find(f"{_w('pPrDefault')}/{_w('pPr')}")
+
+    if pPr is not None:
+        outline_level = pPr.find(_w("outlineLvl"))
+
+        if outline_level is not None:
+            properties["outline_level"] = int(outline_level.get(W_VAL))
+
+        num_id, ilvl = numbering_properties(pPr)
+
+        if num_id is not None:
+            properties["num_id"] = num_id
+
+        if ilvl is not None:
+            properties["list_level"] = ilvl
+
+    rPr = style.find(_w("rPr"))
+
+    if rPr is None:
+        rPr = style.find(f"{_w('rPrDefault')}/{_w('rPr')}")
+
+    if rPr is not None:
+        for tag, key in (("b", "bold"), ("i", "italic")):
+            value = _toggle(rPr, tag)
+
+            if value is not None:
+                properties[key] = value
+
+        size = rPr.find(_w("sz"))
+
+        if size is not None:
+            properties["size"] = int(size.get(W_VAL)) / 2
+
+    return properties
+
+
+class StyleTable:
+    """Every style of a styles.xml, resolved once into `ResolvedStyle`s.
+
+    Built from the w:styles element (`document.styles.element` with
+    python-docx, or styles.xml parsed directly). Looking up a paragraph's
+    Markdown prefix or a run's formatting is then a dict lookup instead of a
+    walk over the styles part. `overrides` maps style names to prefixes and
+    wins over the heading level from the outline level.
+    """
+
+    def __init__(self, styles_element=None, overrides=None):
+        self.overrides = overrides or {}
+        self.styles = {}
+        self.defaults = {}
+
+        if styles_element is None:
+            styles_element = []
+
+        defaults = ResolvedStyle()
+        elements = {}
+
+        for element in styles_element:
+            if element.tag == _w("docDefaults"):
+                for key, value in _own_properties(element).items():
+                    setattr(defaults, key, value)
+            elif element.tag == _w("style"):
+                # the first style with an id wins, as in python-docx
+                elements.setdefault(element.get(_w("styleId")), element)
+
+        def resolve(style_id, seen):
+            if style_id in self.styles:
+                return self.styles[style_id]
+
+            element = elements[style_id]
+            based_on = element.find(_w("basedOn"))
+            parent_id = None if based_on is None else based_on.get(W_VAL)
+
+            if parent_id in elements and parent_id not in seen:
+                parent = resolve(parent_id, seen | {style_id})
+            else:
+                parent = defaults
+
+            name = element.find(_w("name"))
+            name = None if name is None else name.get(W_VAL)
+
+            style = ResolvedStyle(
+                name=UI_STYLE_NAMES.get(name, name),
+                type=element.get(W_TYPE, "paragraph"),
+                outline_level=parent.outline_level,
+                bold=parent.bold,
+                italic=parent.italic,
+                size=parent.size,
+                num_id=parent.num_id,
+                list_level=parent.list_level,
+            )
+
+            for key, value in _own_properties(element).items():
+                setattr(style, key, value)
+
+            self.styles[style_id] = style
+
+            return style
+
+        for style_id, element in elements.items():
+            style = resolve(style_id, {style_id})
+
+            # the last default of a type wins, as in python-docx
+            if _is_on(element.get(_w("default"))):
+                self.defaults[style.type] = style
+
+        self._default_style = defaults
+        self._prefixes = {
+            style_id: self._prefix(style)
+            for style_id, style in self.styles.items()
+            if style.type == "paragraph"
+        }
+        self._default_prefix = self._prefix(self.get(None))
+
+    def _prefix(self, style):
+        if style.name in self.overrides:
+            return self.overrides[style.name]
+
+        if style.heading_level is not None and style.heading_level <= MAX_HEADING_LEVEL:
+            return "#" * style.heading_level + " "
+
+        return ""
+
+    def get(self, style_id, style_type="paragraph"):
+        """Return the style with `style_id`, or the default of `style_type`.
+
+        Like python-docx, a missing id or a style of another type gives the
+        default style.
+        """
+        style = self.styles.get(style_id)
+
+        if style is None or style.type != style_type:
+            return self.defaults.get(style_type, self._default_style)
+
+        return style
+
+    def prefix(self, style_id):
+        """Return the Markdown prefix of a paragraph with style `style_id`."""
+        return self._prefixes.get(style_id, self._default_prefix)
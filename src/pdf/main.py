@@ -1,45 +1,280 @@
-from dataclasses import dataclass, field
+import argparse
+import hashlib
+import io
+import os
+import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from itertools import repeat
 from pathlib import Path
 from collections import Counter
 import fitz
 from pprint import pprint
+from utils import tables as table_finding
 from utils import text_skipping
+from utils.conversion_cache import ConversionCache
+from utils.instrumentation import NULL_RECORDER, Recorder
+from utils.links import LinkIndex
+from utils.markdown_writer import MarkdownWriter
+
+CONVERTER_VERSION = "6"
+
+
+@dataclass(frozen=True)
+class ExtractionProfile:
+    """How much `parse_page` asks of fitz and keeps per span.
+
+    `layout` keeps span flags and bboxes, `links` resolves URI links onto the
+    spans they cover and `tables` writes tables as Markdown tables, which is
+    most of the cost of a profile as it runs `find_tables`. `streaming`
+    profiles extract each page twice (once for the score histogram) to keep
+    memory flat; the others extract once and hold the compact pages instead.
+    """
+
+    name: str
+    flags: int
+    layout: bool = True
+    links: bool = False
+    tables: bool = False
+    streaming: bool = True
+
+
+PROFILES = {
+    # the same extraction as standard; fast skips the second pass instead
+    "fast": ExtractionProfile(
+        name="fast",
+        flags=fitz.TEXTFLAGS_TEXT,
+        layout=False,
+        tables=False,
+        streaming=False,
+    ),
+    "standard": ExtractionProfile(name="standard", flags=fitz.TEXTFLAGS_TEXT),
+    "rich": ExtractionProfile(
+        name="rich", flags=fitz.TEXTFLAGS_TEXT, links=True, tables=True
+    ),
+}
+
+
+@dataclass(slots=True)
+class Page:
+    """Columnar span storage for one page.
+
+    Span text is kept in one shared buffer addressed by `text_offsets`, span
+    attributes in flat arrays (`bboxes` holds x0, y0, x1, y1 per span), and
+    lines and blocks as index ranges: line `i` covers spans
+    `line_starts[i]:line_starts[i + 1]` and block `j` covers lines
+    `block_starts[j]:block_starts[j + 1]`. `line_bounds` holds y0, y1 of the
+    first span of each line, for every profile, so running lines can be told
+    by position. `flags` and `bboxes` are empty for profiles without layout,
+    and `span_links` indexes `link_uris` (-1 for no
+    link) only for profiles with links. Table `k` is written as Markdown in
+    `tables[k]`, covers `table_bboxes[4 * k : 4 * k + 4]` and goes before line
+    `table_lines[k]`; its text is not in the lines. `skip_counter` holds the
+    lines dropped while parsing, so a cached page still reports them.
+    """
+
+    height: float = 0.0
+    text: str = ""
+    text_offsets: array = field(default_factory=lambda: array("I", [0]))
+    sizes: array = field(default_factory=lambda: array("f"))
+    flags: array = field(default_factory=lambda: array("i"))
+    bboxes: array = field(default_factory=lambda: array("f"))
+    line_starts: array = field(default_factory=lambda: array("I"))
+    line_scores: array = field(default_factory=lambda: array("i"))
+    line_bounds: array = field(default_factory=lambda: array("f"))
+    block_starts: array = field(default_factory=lambda: array("I"))
+    span_links: array = field(default_factory=lambda: array("i"))
+    link_uris: list[str] = field(default_factory=list)
+    tables: list[str] = field(default_factory=list)
+    table_bboxes: array = field(default_factory=lambda: array("d"))
+    table_lines: array = field(default_factory=lambda: array("I"))
+    score_counter: Counter = field(default_factory=Counter)
+    skip_counter: Counter = field(default_factory=Counter)
+
+    def span_text(self, span_index):
+        return self.text[
+            self.text_offsets[span_index] : self.text_offsets[span_index + 1]
+        ]
+
+    def line_text(self, line_index):
+        return " ".join(
+            [
+                self.span_text(span_index)
+                for span_index in range(
+                    self.line_starts[line_index], self.line_starts[line_index + 1]
+                )
+            ]
+        ).strip()
+
+    def line_markdown(self, line_index):
+        """Like `line_text`, but with linked spans written as Markdown links."""
+        if len(self.span_links) == 0:
+            return self.line_text(line_index)
+
+        texts = []
+
+        for span_index in range(
+            self.line_starts[line_index], self.line_starts[line_index + 1]
+        ):
+            text = self.span_text(span_index)
+            link_index = self.span_links[span_index]
+
+            if link_index >= 0:
+                text = f"[{text}]({self.link_uris[link_index]})"
+
+            texts.append(text)
+
+        return " ".join(texts).strip()
+
+
+re_reference = re.compile(r"(/(?:P|Parent|Group) )?(\d+) \d+ R")
+re_stream_encoding = re.compile(
+    r"/(?:Length|DL) \d+(?: \d+ R)?|/Filter ?(?:/\w+|\[[^]]*\])"
+    r"|/DecodeParms ?(?:<<[^>]*>>|\[[^]]*\])"
+)
+
+
+def _object_digest(doc, xref, memo):
+    """Digest an object and everything it references, independent of xref numbers.
+
+    Streams are digested decoded, so recompressing a file doesn't change the
+    digest, and images not at all, as they carry no text. /Parent and /P
+    references are not followed, as they lead back up to the page tree and so
+    to every other page, nor are /Group ones, which only set transparency.
+    """
+    if xref not in memo:
+        # breaks reference cycles
+        memo[xref] = b""
+
+        source = doc.xref_object(xref, compressed=True)
+        digest = hashlib.blake2b(digest_size=16)
+
+        if "/Subtype/Image" in source:
+            digest.update(b"image")
+        elif doc.xref_is_stream(xref):
+            source = re_stream_encoding.sub("", source)
+            digest.update(_resolve_references(doc, source, memo))
+            digest.update(doc.xref_stream(xref))
+        else:
+            digest.update(_resolve_references(doc, source, memo))
 
+        memo[xref] = digest.digest()
 
-@dataclass
-class Span:
-    score: float
-    text: str
+    return memo[xref]
 
 
-@dataclass
-class Line:
-    score: float
-    spans: list = field(default_factory=list)
+def _resolve_references(doc, source, memo):
+    def resolve(match):
+        if match.group(1) is not None:
+            return match.group(1)
 
+        return _object_digest(doc, int(match.group(2)), memo).hex()
 
-@dataclass
-class Block:
-    lines: list[Line] = field(default_factory=list)
+    return re_reference.sub(resolve, source).encode()
 
 
-@dataclass
-class Page:
-    scores: list[float] = field(default_factory=list)
-    blocks: list[Block] = field(default_factory=list)
+def page_fingerprint(doc, page, memo=None) -> str:
+    """Hash what the text of `page` is drawn from.
+
+    That is the content streams, the resources (fonts, form XObjects, ...)
+    with everything they reference, the page boxes and rotation, and the URI
+    links. Resources are looked up through the page tree when inherited.
+    `memo` shares object digests between pages of the same document, so a
+    font used on every page is only hashed once.
+    """
+    if memo is None:
+        memo = {}
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((page.mediabox, page.cropbox, page.rotation)).encode())
+
+    for xref in page.get_contents():
+        digest.update(_object_digest(doc, xref, memo))
+
+    xref = page.xref
+
+    while xref > 0:
+        key_type, value = doc.xref_get_key(xref, "Resources")
+
+        if key_type != "null":
+            digest.update(_resolve_references(doc, value, memo))
+            break
+
+        key_type, value = doc.xref_get_key(xref, "Parent")
+        xref = int(value.split()[0]) if key_type == "xref" else 0
+
+    for link in page.get_links():
+        if link["kind"] == fitz.LINK_URI:
+            digest.update(repr((link["from"], link["uri"])).encode())
+
+    return digest.hexdigest()
+
+
+def find_page_tables(page, page_blocks, min_filled_share=0.4):
+    """Return `(rect, markdown)` for each table on `page`, top to bottom.
+
+    Tables need at least two rows and two columns, smaller ones being nearly
+    always a ruled box around some text, and at least `min_filled_share` of
+    their cells filled. The text of tables left out stays in the lines.
+    """
+    line_bboxes = [
+        l["bbox"] for b in page_blocks for l in b["lines"] if l["dir"] == (1.0, 0.0)
+    ]
+    tables = []
+
+    for table in table_finding.find_tables(page, line_bboxes=line_bboxes):
+        if table.row_count < 2 or table.col_count < 2:
+            continue
+
+        rows = table.extract()
+
+        if table_finding.filled_share(rows) < min_filled_share:
+            continue
+
+        rect = fitz.Rect(table.bbox) | table.header.bbox
+        tables.append((rect, table_finding.table_to_markdown(table, rows)))
+
+    return sorted(tables, key=lambda table: (table[0].y0, table[0].x0))
+
+
+def parse_page(
+    page,
+    skip_counter,
+    recorder=NULL_RECORDER,
+    profile=PROFILES["standard"],
+) -> Page:
+    """Parse `page` into a `Page`."""
+    result = Page(height=page.rect.height)
+    texts = []
 
+    with recorder.stage("pdf.extract"):
+        page_blocks = page.get_text("dict", flags=profile.flags)["blocks"]
 
-def parse_page(page, score_counter, skip_counter) -> Page:
-    max_score = None
-    min_score = None
-    scores = set()
+    link_index = None
 
-    blocks = []
+    if profile.links:
+        with recorder.stage("pdf.links"):
+            link_index = LinkIndex.from_page(page)
+            result.link_uris = [l["uri"] for l in link_index.links]
 
-    for b in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
-        lines = []
+    tables = []
 
-        current_line = None
+    if profile.tables:
+        with recorder.stage("pdf.tables"):
+            tables = find_page_tables(page, page_blocks)
+
+    for b in page_blocks:
+        # a table goes before the first block below its top
+        while len(result.tables) < len(tables) and (
+            tables[len(result.tables)][0].y0 <= b["bbox"][1]
+        ):
+            _add_table(result, *tables[len(result.tables)])
+
+        result.block_starts.append(len(result.line_scores))
+
+        current_score = None
+        is_skipped_line = False
 
         for l in b["lines"]:
             spans = []
@@ -50,59 +285,175 @@ def parse_page(page, score_counter, skip_counter) -> Page:
                     continue
 
                 # font_size = f"{s['size']:0.2}"
-                score = round(s["size"])
-
-                if max_score is None or score > max_score:
-                    max_score = score
-
-                if min_score is None or score < min_score:
-                    min_score = score
-
-                span = Span(score=score, text=text)
-
-                spans.append(span)
+                spans.append(s)
 
             if len(spans) == 0:
                 continue
 
-            max_span_score = max([s.score for s in spans])
-            scores.add(max_span_score)
-            score_counter.update([max_span_score])
+            line_score = max([round(s["size"]) for s in spans])
+            result.score_counter.update([line_score])
+
+            if len(tables) > 0 and _in_tables(l["bbox"], tables):
+                current_score = None
+                continue
 
-            line_score = max_span_score
+            if current_score is None or current_score != line_score:
+                current_score = line_score
+                is_skipped_line = text_skipping.should_skip(text)
 
-            if current_line is None or current_line.score != line_score:
-                current_line = Line(score=line_score, spans=spans)
-                if text_skipping.should_skip(text):
+                if is_skipped_line:
                     skip_counter[text] += 1
+                    result.skip_counter[text] += 1
                     continue
 
-                lines.append(current_line)
+                result.line_starts.append(len(result.sizes))
+                result.line_scores.append(line_score)
+                result.line_bounds.extend(spans[0]["bbox"][1::2])
 
-            else:
-                current_line.spans += spans
-
-        block = Block(lines=lines)
-        blocks.append(block)
+            elif is_skipped_line:
+                continue
 
-    return Page(blocks=blocks, scores=list(sorted(scores, reverse=True)))
+            for s in spans:
+                span_text = s["text"].strip()
+                texts.append(span_text)
+                result.text_offsets.append(result.text_offsets[-1] + len(span_text))
+                result.sizes.append(s["size"])
 
+                if profile.layout:
+                    result.flags.append(s["flags"])
+                    result.bboxes.extend(s["bbox"])
 
-def render(page: Page, level_for_score: dict, skip_counter: Counter):
+                if link_index is not None:
+                    result.span_links.append(link_index.find(s["bbox"]))
+
+    for rect, markdown in tables[len(result.tables) :]:
+        _add_table(result, rect, markdown)
+
+    result.line_starts.append(len(result.sizes))
+    result.block_starts.append(len(result.line_scores))
+    result.text = "".join(texts)
+
+    return result
+
+
+def _count_page(recorder, page: Page):
+    recorder.count("pdf.spans", len(page.sizes))
+    recorder.count("pdf.tables", len(page.tables))
+    recorder.count("pdf.lines", len(page.line_scores))
+
+
+def _add_table(result, rect, markdown):
+    result.table_lines.append(len(result.line_scores))
+    result.table_bboxes.extend(rect)
+    result.tables.append(markdown)
+
+
+def _in_tables(bbox, tables):
+    x = (bbox[0] + bbox[2]) / 2
+    y = (bbox[1] + bbox[3]) / 2
+
+    return any(
+        [rect.x0 <= x <= rect.x1 and rect.y0 <= y <= rect.y1 for rect, _ in tables]
+    )
+
+
+class RunningLineIndex:
+    """Per-document index of running headers, footers and disclaimers.
+
+    Lines are fingerprinted by their normalized text (case folded, digits
+    collapsed so page numbers match) plus their quantized vertical position.
+    Fingerprints found on at least `min_share` of the pages, and on at least
+    `min_pages` pages, are treated as running lines. Only lines starting in
+    the top or ending in the bottom `band` of the page are candidates, so the
+    index holds the page margins rather than the whole text.
+    """
+
+    def __init__(self, min_share=0.5, min_pages=3, y_quantum=10.0, band=0.15):
+        self.min_share = min_share
+        self.min_pages = min_pages
+        self.y_quantum = y_quantum
+        self.band = band
+        self.page_count = 0
+        self.page_counter = Counter()
+        self.running = set()
+
+    def fingerprint(self, page: Page, line_index):
+        text = " ".join(re.sub(r"\d+", "#", page.line_text(line_index).lower()).split())
+        y_bucket = round(page.line_bounds[2 * line_index] / self.y_quantum)
+        digest = hashlib.blake2b(f"{y_bucket}:{text}".encode(), digest_size=8)
+
+        return int.from_bytes(digest.digest(), "little")
+
+    def is_candidate(self, page: Page, line_index):
+        y0 = page.line_bounds[2 * line_index]
+        y1 = page.line_bounds[2 * line_index + 1]
+        margin = self.band * page.height
+
+        return y0 <= margin or y1 >= page.height - margin
+
+    def add_page(self, page: Page):
+        self.page_count += 1
+        self.page_counter.update(
+            {
+                self.fingerprint(page, line_index)
+                for line_index in range(len(page.line_scores))
+                if self.is_candidate(page, line_index)
+            }
+        )
+
+    def finalize(self):
+        min_count = max(self.min_pages, self.min_share * self.page_count)
+        self.running = {
+            fingerprint
+            for fingerprint, count in self.page_counter.items()
+            if count >= min_count
+        }
+        self.page_counter = Counter()
+
+        return self
+
+    def is_running(self, page: Page, line_index):
+        return (
+            len(self.running) > 0
+            and self.is_candidate(page, line_index)
+            and self.fingerprint(page, line_index) in self.running
+        )
+
+
+def render(
+    page: Page,
+    level_for_score: dict,
+    skip_counter: Counter,
+    running_index: RunningLineIndex = None,
+):
     results = []
+    table_index = 0
 
     # most common font size == body (no #)
-    for block in page.blocks:
-        for line in block.lines:
-            text = " ".join([span.text for span in line.spans]).strip()
+    for line_index, score in enumerate(page.line_scores):
+        while (
+            table_index < len(page.tables)
+            and page.table_lines[table_index] <= line_index
+        ):
+            results.append(f"\n{page.tables[table_index]}\n")
+            table_index += 1
 
-            if text_skipping.should_skip(text):
-                skip_counter[text] += 1
-                continue
+        text = page.line_text(line_index)
+
+        if text_skipping.should_skip(text):
+            skip_counter[text] += 1
+            continue
+
+        if running_index is not None and running_index.is_running(page, line_index):
+            skip_counter[text] += 1
+            continue
 
-            prefix = level_for_score[line.score]
+        prefix = level_for_score[score]
 
-            results.append(f"{prefix} {text}")
+        results.append(f"{prefix} {page.line_markdown(line_index)}")
+
+    for table in page.tables[table_index:]:
+        results.append(f"\n{table}\n")
 
     return results
 
@@ -122,40 +473,498 @@ def calculate_heading_levels(score_counter):
     return level_for_score
 
 
-def to_markdown(input_file):
+def count_page_scores(page, score_counter, profile=PROFILES["standard"]):
+    for b in page.get_text("dict", flags=profile.flags)["blocks"]:
+        for l in b["lines"]:
+            span_scores = [
+                round(s["size"]) for s in l["spans"] if len(s["text"].strip()) > 0
+            ]
+
+            if len(span_scores) == 0:
+                continue
+
+            score_counter.update([max(span_scores)])
+
+
+def parse_page_spec(spec, page_count) -> list[int]:
+    """Turn a spec such as "2-15,40,43-N" into 0-based page numbers.
+
+    Page numbers in the spec are 1-based and "N" stands for the last page.
+    A page selected more than once is kept where it first appears.
+    """
+    page_numbers = []
+
+    for item in spec.split(","):
+        bounds = item.strip().split("-")
+
+        if not 1 <= len(bounds) <= 2 or not all(
+            re.fullmatch(r"\d+|N", bound.strip()) for bound in bounds
+        ):
+            raise ValueError(f"Invalid page range {item!r} in {spec!r}")
+
+        numbers = [
+            page_count if bound.strip() == "N" else int(bound) for bound in bounds
+        ]
+        start, end = numbers[0], numbers[-1]
+
+        if start > end:
+            raise ValueError(f"Page range {item!r} in {spec!r} ends before it starts")
+
+        page_numbers.extend(range(start - 1, end))
+
+    wrong_pages = sorted({n + 1 for n in page_numbers if not 0 <= n < page_count})
+    if len(wrong_pages) > 0:
+        raise ValueError(f"Page number(s) {wrong_pages[:4]} not in 1-{page_count}")
+
+    return list(dict.fromkeys(page_numbers))
+
+
+def _resolve_page_numbers(doc, page_numbers):
+    if page_numbers is None:
+        return range(doc.page_count)
+
+    if isinstance(page_numbers, str):
+        return parse_page_spec(page_numbers, doc.page_count)
+
+    if len(page_numbers) == 0:
+        raise ValueError("No pages selected")
+
+    wrong_pages = sorted({n for n in page_numbers if not 0 <= n < doc.page_count})
+    if len(wrong_pages) > 0:
+        raise ValueError(
+            f"Page number(s) {wrong_pages[:4]} not in 0-{doc.page_count - 1}"
+        )
+
+    return list(dict.fromkeys(page_numbers))
+
+
+def iter_markdown(
+    input_file,
+    skip_counter=None,
+    running_line_share=0.5,
+    recorder=NULL_RECORDER,
+    profile="standard",
+    page_numbers=None,
+):
+    """Yield the Markdown for each page of `input_file` in order.
+
+    Heading levels are calibrated from a first pass that only keeps a
+    histogram of line scores and, when `running_line_share` is set, the
+    fingerprints of the lines in the page margins (see `RunningLineIndex`).
+    Memory grows with the distinct margin lines rather than with the text.
+    The first pass skips tables and links, which the second pass finds.
+    `page_numbers` (0-based, or a spec for `parse_page_spec`)
+    limits both passes, and so the heading calibration, to those pages.
+    """
+    if skip_counter is None:
+        skip_counter = Counter()
+
+    profile = PROFILES[profile]
     doc = fitz.open(input_file)
+    page_numbers = _resolve_page_numbers(doc, page_numbers)
 
     score_counter = Counter()
+    running_index = None
+
+    # table lines count for the scores either way, and are never rendered as
+    # lines, so the first pass has no need to find tables
+    score_profile = replace(profile, tables=False, links=False)
+
+    if running_line_share is not None:
+        running_index = RunningLineIndex(min_share=running_line_share)
+
+    with recorder.stage("pdf.score_pass"):
+        for page_number in page_numbers:
+            page = doc.load_page(page_number)
 
-    pages = [parse_page(page, score_counter) for page in doc.pages()]
+            if running_index is None:
+                count_page_scores(page, score_counter, profile=profile)
+                continue
+
+            parsed_page = parse_page(
+                page, skip_counter=Counter(), recorder=recorder, profile=score_profile
+            )
+            score_counter.update(parsed_page.score_counter)
+            running_index.add_page(parsed_page)
+
+        if running_index is not None:
+            running_index.finalize()
+
+    with recorder.stage("pdf.calculate_heading_levels"):
+        level_for_score = calculate_heading_levels(score_counter)
+
+    for page_number in page_numbers:
+        with recorder.stage("pdf.parse_page"):
+            parsed_page = parse_page(
+                doc.load_page(page_number),
+                skip_counter=skip_counter,
+                recorder=recorder,
+                profile=profile,
+            )
+
+        _count_page(recorder, parsed_page)
 
-    level_for_score = calculate_heading_levels(score_counter)
+        with recorder.stage("pdf.render"):
+            rendered_lines = render(
+                parsed_page,
+                level_for_score,
+                skip_counter=skip_counter,
+                running_index=running_index,
+            )
+
+        recorder.count("pdf.pages")
+
+        yield "\n".join(rendered_lines)
+
+
+def _parse_shard(input_file, page_numbers, record=False, profile="standard"):
+    doc = fitz.open(input_file)
 
-    rendered_lines = []
     skip_counter = Counter()
+    recorder = Recorder() if record else NULL_RECORDER
+    pages = []
+
+    for page_number in page_numbers:
+        with recorder.stage("pdf.parse_page"):
+            pages.append(
+                parse_page(
+                    doc.load_page(page_number),
+                    skip_counter,
+                    recorder=recorder,
+                    profile=PROFILES[profile],
+                )
+            )
+
+        _count_page(recorder, pages[-1])
+
+    return pages, skip_counter, recorder
+
+
+def parse_pages(
+    input_file,
+    workers=None,
+    skip_counter=None,
+    recorder=NULL_RECORDER,
+    profile="standard",
+    page_numbers=None,
+) -> list[Page]:
+    """Parse the selected pages of `input_file` (all by default) on a process pool.
+
+    The page list is split into contiguous shards. Each worker opens its own
+    document and returns the columnar pages in their original order.
+    """
+    if skip_counter is None:
+        skip_counter = Counter()
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    with fitz.open(input_file) as doc:
+        page_numbers = list(_resolve_page_numbers(doc, page_numbers))
+
+    page_count = len(page_numbers)
+    shard_count = min(page_count, workers * 4) or 1
+    shard_size = -(-page_count // shard_count)
+    shards = [
+        page_numbers[start : start + shard_size]
+        for start in range(0, page_count, shard_size)
+    ]
+
+    if workers == 1:
+        results = [_parse_shard(input_file, page_numbers, recorder.enabled, profile)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    _parse_shard,
+                    repeat(str(input_file)),
+                    shards,
+                    repeat(recorder.enabled),
+                    repeat(profile),
+                )
+            )
+
+    pages = []
+
+    for shard_pages, shard_skip_counter, shard_recorder in results:
+        pages += shard_pages
+        skip_counter.update(shard_skip_counter)
+        recorder.merge(shard_recorder)
+
+    recorder.count("pdf.pages", len(pages))
+
+    return pages
+
+
+def load_pages(
+    input_file,
+    workers=None,
+    skip_counter=None,
+    cache=None,
+    recorder=NULL_RECORDER,
+    profile="standard",
+    page_numbers=None,
+) -> list[Page]:
+    """Like `parse_pages`, but reuse the pages stored in `cache` when present.
+
+    Pages are cached by `page_fingerprint` rather than by file, so a revised
+    document only has its changed pages parsed again.
+    """
+    if cache is None:
+        return parse_pages(
+            input_file,
+            workers=workers,
+            skip_counter=skip_counter,
+            recorder=recorder,
+            profile=profile,
+            page_numbers=page_numbers,
+        )
+
+    if skip_counter is None:
+        skip_counter = Counter()
+
+    with recorder.stage("pdf.fingerprint"), fitz.open(input_file) as doc:
+        page_numbers = list(_resolve_page_numbers(doc, page_numbers))
+        memo = {}
+        keys = [
+            cache.content_key(
+                page_fingerprint(doc, doc.load_page(page_number), memo),
+                converter="pdf-page",
+                version=CONVERTER_VERSION,
+                options={"profile": profile},
+            )
+            for page_number in page_numbers
+        ]
+
+    with recorder.stage("pdf.cache_read"):
+        pages = [cache.get_records(key) for key in keys]
+
+    changed = [index for index, page in enumerate(pages) if page is None]
+
+    if len(changed) > 0:
+        parsed_pages = parse_pages(
+            input_file,
+            workers=workers,
+            recorder=recorder,
+            profile=profile,
+            page_numbers=[page_numbers[index] for index in changed],
+        )
+
+        for index, page in zip(changed, parsed_pages):
+            pages[index] = page
+            cache.put_records(keys[index], page)
+
+    recorder.count("pdf.cached_pages", len(pages) - len(changed))
+
+    for page in pages:
+        skip_counter.update(page.skip_counter)
+
+    return pages
+
+
+def render_pages(
+    pages, skip_counter=None, running_line_share=0.5, recorder=NULL_RECORDER
+):
+    """Yield the Markdown for each parsed page in order.
+
+    The pages' score counters are merged before heading levels are calculated
+    once.
+    """
+    if skip_counter is None:
+        skip_counter = Counter()
 
-    for page_index, page in enumerate(pages):
-        # rendered_lines.append(f"PAGE {page_index +1}")
-        rendered_lines += render(page, level_for_score, skip_counter=skip_counter)
+    score_counter = Counter()
+
+    for page in pages:
+        score_counter.update(page.score_counter)
+
+    with recorder.stage("pdf.calculate_heading_levels"):
+        level_for_score = calculate_heading_levels(score_counter)
+
+    running_index = None
+
+    if running_line_share is not None:
+        with recorder.stage("pdf.running_line_index"):
+            running_index = RunningLineIndex(min_share=running_line_share)
+
+            for page in pages:
+                running_index.add_page(page)
+
+            running_index.finalize()
+
+    for page in pages:
+        with recorder.stage("pdf.render"):
+            rendered_lines = render(page, level_for_score, skip_counter, running_index)
+
+        yield "\n".join(rendered_lines)
+
+
+def iter_markdown_parallel(
+    input_file,
+    workers=None,
+    skip_counter=None,
+    running_line_share=0.5,
+    cache=None,
+    recorder=NULL_RECORDER,
+    profile="standard",
+    page_numbers=None,
+):
+    """Yield the Markdown for each page of `input_file`, parsing on a process pool."""
+    if skip_counter is None:
+        skip_counter = Counter()
+
+    pages = load_pages(
+        input_file,
+        workers=workers,
+        skip_counter=skip_counter,
+        cache=cache,
+        recorder=recorder,
+        profile=profile,
+        page_numbers=page_numbers,
+    )
+
+    yield from render_pages(
+        pages,
+        skip_counter=skip_counter,
+        running_line_share=running_line_share,
+        recorder=recorder,
+    )
+
+
+def write_markdown(
+    input_file,
+    output,
+    skip_counter=None,
+    workers=1,
+    running_line_share=0.5,
+    cache=None,
+    recorder=NULL_RECORDER,
+    profile="standard",
+    page_numbers=None,
+):
+    """Write the Markdown for `input_file` to `output` page by page.
+
+    `output` is a text stream or a `MarkdownWriter`. `profile` names one of
+    `PROFILES`. `page_numbers` selects pages, either as 0-based numbers or as
+    a spec such as "2-15,40,43-N". With a `cache`, the parsed pages are kept
+    in (and reused from) the cache, which means holding them all in memory
+    rather than streaming.
+    """
+    if workers == 1 and cache is None and PROFILES[profile].streaming:
+        pages_markdown = iter_markdown(
+            input_file,
+            skip_counter=skip_counter,
+            running_line_share=running_line_share,
+            recorder=recorder,
+            profile=profile,
+            page_numbers=page_numbers,
+        )
+    else:
+        pages_markdown = iter_markdown_parallel(
+            input_file,
+            workers=workers,
+            skip_counter=skip_counter,
+            running_line_share=running_line_share,
+            cache=cache,
+            recorder=recorder,
+            profile=profile,
+            page_numbers=page_numbers,
+        )
+
+    writer = output
+
+    if not isinstance(writer, MarkdownWriter):
+        writer = MarkdownWriter(output, separator="\n")
+
+    for page_markdown in pages_markdown:
+        if len(page_markdown) > 0:
+            writer.write(page_markdown)
+
+    writer.flush()
+
+
+def to_markdown(
+    input_file,
+    workers=1,
+    running_line_share=0.5,
+    cache=None,
+    recorder=NULL_RECORDER,
+    profile="standard",
+    page_numbers=None,
+):
+    skip_counter = Counter()
+
+    output = io.StringIO()
+
+    with recorder.stage("pdf.to_markdown"):
+        write_markdown(
+            input_file,
+            output,
+            skip_counter=skip_counter,
+            workers=workers,
+            running_line_share=running_line_share,
+            cache=cache,
+            recorder=recorder,
+            profile=profile,
+            page_numbers=page_numbers,
+        )
 
-    rendered = "\n".join(rendered_lines)
+    recorder.count("pdf.skipped", sum(skip_counter.values()))
 
     pprint(skip_counter.most_common())
 
-    return rendered
+    return output.getvalue()
 
 
 def _main():
     base_dir = Path(__file__).parents[2]
     data_dir = base_dir / "data"
-    input_file = data_dir / "JPM Electravision 14th Annual Energy Paper 20240305.pdf"
 
-    output = to_markdown(input_file=input_file)
+    parser = argparse.ArgumentParser(description="Convert a PDF to Markdown.")
+    parser.add_argument(
+        "input_file",
+        nargs="?",
+        type=Path,
+        default=data_dir / "JPM Electravision 14th Annual Energy Paper 20240305.pdf",
+    )
+    parser.add_argument(
+        "--pages", help='pages to convert, e.g. "2-15,40,43-N" (default: all)'
+    )
+    parser.add_argument("--profile", choices=list(PROFILES), default="standard")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    input_file = args.input_file
 
     output_dir = base_dir / "output"
     output_dir.mkdir(parents=True, exist_ok=True)
     output_file = output_dir / f"{input_file.name}.md"
-    output_file.write_text(output)
+
+    skip_counter = Counter()
+
+    cache = ConversionCache(output_dir / "cache")
+    cache.markdown_file(
+        input_file,
+        output_file,
+        converter="pdf",
+        version=CONVERTER_VERSION,
+        options={
+            "running_line_share": 0.5,
+            "profile": args.profile,
+            "pages": args.pages,
+        },
+        write=lambda output: write_markdown(
+            input_file,
+            output,
+            skip_counter=skip_counter,
+            workers=args.workers,
+            cache=cache,
+            profile=args.profile,
+            page_numbers=args.pages,
+        ),
+    )
+
+    pprint(skip_counter.most_common())
 
 
 if __name__ == "__main__":
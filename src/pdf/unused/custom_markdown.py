@@ -2,6 +2,9 @@ import string
 from pathlib import Path
 import fitz
 
+from utils.links import LinkIndex
+from utils.tables import find_tables
+
 
 class IdentifyHeaders:
 
@@ -51,25 +54,15 @@ class IdentifyHeaders:
         return hdr_id
 
 
-def resolve_links(links, span):
-    """Accept a span bbox and return a markdown link string."""
-    bbox = fitz.Rect(span["bbox"])
-
-    # a link should overlap at least 70% of the span
-    bbox_area = 0.7 * abs(bbox)
-
-    for link in links:
-        hot = link["from"]
-        if not abs(hot & bbox) >= bbox_area:
-            continue  # does not touch the bbox
-        text = f'[{span["text"].strip()}]({link["uri"]})'
-        return text
+def ends_with_newline(fragments) -> bool:
+    return len(fragments) > 0 and fragments[-1].endswith("\n")
 
 
-def write_text(page, clip):
-    out_string = ""
+def write_text(page, clip, link_index=None):
+    out = []  # fragments, joined once at the end
 
-    links = [l for l in page.get_links() if l["kind"] == 2]
+    if link_index is None:
+        link_index = LinkIndex.from_page(page)
 
     blocks = page.get_text(
         "dict",
@@ -91,8 +84,8 @@ def write_text(page, clip):
 
             text = "".join([s["text"] for s in spans])
 
-            if not out_string.endswith("\n"):
-                out_string += "\n"
+            if not ends_with_newline(out):
+                out.append("\n")
 
             for i, s in enumerate(spans):
                 mono = s["flags"] & 8
@@ -100,7 +93,7 @@ def write_text(page, clip):
                 italic = s["flags"] & 2
 
                 if mono:
-                    out_string += f"`{s['text'].strip()}` "
+                    out.append(f"`{s['text'].strip()}` ")
                 else:
                     if i == 0:
                         hdr_string = "#"
@@ -119,7 +112,7 @@ def write_text(page, clip):
                             prefix += "_"
                             suffix = "_" + suffix
 
-                    ltext = resolve_links(links, s)
+                    ltext = link_index.resolve(s)
                     if ltext:
                         text = f"{hdr_string}{prefix}{ltext}{suffix} "
                     else:
@@ -132,26 +125,23 @@ def write_text(page, clip):
                         .replace(chr(8226), "-")
                         .replace(chr(9679), "-")
                     )
-                    out_string += text
+                    out.append(text)
 
             previous_y = this_y
-            out_string += "\n"
+            out.append("\n")
 
-        out_string += "\n"
+        out.append("\n")
 
-    return out_string.replace(" \n", "\n")
+    return "".join(out).replace(" \n", "\n")
 
 
 def find_clip_rects(page):
-    tabs = page.find_tables()
+    tabs = find_tables(page)
 
     # 2. make a list of table boundary boxes, sort by top-left corner.
     # Must include the header bbox, which may be external.
     tab_rects = sorted(
-        [
-            (fitz.Rect(t.bbox) | fitz.Rect(t.header.bbox), i)
-            for i, t in enumerate(tabs.tables)
-        ],
+        [(fitz.Rect(t.bbox) | fitz.Rect(t.header.bbox), i) for i, t in enumerate(tabs)],
         key=lambda r: (r[0].y0, r[0].x0),
     )
 
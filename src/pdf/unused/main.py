@@ -6,7 +6,10 @@ from pprint import pformat
 
 import utils.annotator as annotator
 import fitz
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 
 @dataclass
@@ -16,17 +19,22 @@ class Line:
 
 
 @dataclass
-class Chunk:
-    score: float
-    features: dict
-    text: str = ""
-    # lines: list[Line] = field(default_factory=list)
+class PageBatch:
+    """Consecutive pages and their chunks, the chunks as columns.
 
+    `chunk_pages` holds the page index of each chunk and `chunk_indices` its
+    index on that page. `features` is the dict of `score_lines` over all
+    chunks of the batch, "score" included, and `bboxes` the (n, 4) array of
+    their block bboxes.
+    """
 
-@dataclass
-class Page:
-    text: str
-    chunks: list[Chunk] = field(default_factory=list)
+    pages: list[int] = field(default_factory=list)
+    texts: list[str] = field(default_factory=list)
+    chunk_pages: list[int] = field(default_factory=list)
+    chunk_indices: list[int] = field(default_factory=list)
+    chunk_texts: list[str] = field(default_factory=list)
+    bboxes: np.ndarray | None = None
+    features: dict = field(default_factory=dict)
 
 
 def flags_decomposer(flags):
@@ -58,38 +66,45 @@ def is_superscript(span):
     return int(span["flags"] & 1) == 1
 
 
-def calculate_line_score(bbox, l):
-    s = l["spans"][0]
+SCORE_WEIGHTS = {"size": 1.0, "bold": 1.0, "x": 1.0}
 
-    first_span_style = {
-        "name": s["font"],
-        "style": flags_decomposer(s["flags"]),
-        "size": s["size"],
-        "colour": s["color"],
-    }
 
-    x = bbox[0]
-    y = bbox[1]
-    width = bbox[2] - bbox[0]
-    height = bbox[3] - bbox[1]
+def score_lines(sizes, flags, bboxes, page_sizes=None, weights=SCORE_WEIGHTS):
+    """Compute the features and weighted scores of many lines at once.
+
+    `sizes` and `flags` are per line (of its first span), `bboxes` is an
+    (n, 4) array and `page_sizes` an (n, 2) array of page width and height,
+    used for `x_norm` and `y_norm`. The arrays may span a page or a whole
+    corpus. `weights` maps feature names to their weight in the score.
+    Returns a dict of feature name to array, including "score".
+    """
+    sizes = np.asarray(sizes, dtype=float)
+    flags = np.asarray(flags, dtype=np.int64)
+    bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4)
 
-    score_weights = {"size": 1.0, "bold": 1.0, "x": 1.0}
-    score = (
-        score_weights["size"] * first_span_style["size"]
-        + score_weights["bold"] * is_bold(s)
-        + score_weights["x"] * x  # / page_width
-    )
     features = {
-        "size": first_span_style["size"],
-        "bold": is_bold(s),
-        "x": x,  # / page_width,
-        "y": y,  # / page_height,
-        "width": width,
-        "height": height,
-        "bbox": bbox,
+        "size": sizes,
+        "bold": (flags & 2**4) != 0,
+        "superscript": (flags & 2**0) != 0,
+        "x": bboxes[:, 0],
+        "y": bboxes[:, 1],
+        "width": bboxes[:, 2] - bboxes[:, 0],
+        "height": bboxes[:, 3] - bboxes[:, 1],
     }
 
-    return score, features
+    if page_sizes is not None:
+        page_sizes = np.asarray(page_sizes, dtype=float).reshape(-1, 2)
+        features["x_norm"] = bboxes[:, 0] / page_sizes[:, 0]
+        features["y_norm"] = bboxes[:, 1] / page_sizes[:, 1]
+
+    score = np.zeros(len(sizes))
+
+    for name, weight in weights.items():
+        score += weight * features[name]
+
+    features["score"] = score
+
+    return features
 
 
 def format_outline(outline, level):
@@ -160,14 +175,51 @@ def collect_source_references(line, block, references):
     return None
 
 
-def load_text(pdf) -> list[Page]:
-    results_pages = []
+def page_text(page_dict):
+    """Return the plain text of a "dict" extraction, as `get_page_text` does."""
+    return "".join(
+        [
+            "".join([s["text"] for s in l["spans"]]) + "\n"
+            for b in page_dict["blocks"]
+            if b["type"] == 0
+            for l in b["lines"]
+        ]
+    )
+
+
+def iter_text(pdf, score_weights=SCORE_WEIGHTS, batch_size=None):
+    """Yield the pages of `pdf` as `PageBatch`es, extracting each page once.
+
+    A chunk is scored by the first span of its last line and its block bbox.
+    The chunks of `batch_size` pages, `PAGE_BATCH_SIZE` by default, are
+    scored with one `score_lines` call.
+    """
+    batch_size = batch_size or PAGE_BATCH_SIZE
+    batch = PageBatch()
+    sizes = []
+    flags = []
+    bboxes = []
+    page_sizes = []
+
+    def scored_batch():
+        batch.bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4)
+        batch.features = score_lines(
+            sizes,
+            flags,
+            batch.bboxes,
+            page_sizes=page_sizes,
+            weights=score_weights,
+        )
+
+        return batch
 
     for page_index, pdf_page in enumerate(pdf.pages()):
         page_dict = pdf_page.get_text("dict")
-        page = Page(text=pdf.get_page_text(page_index))
+        page_size = (page_dict["width"], page_dict["height"])
+        chunk_index = 0
 
-        page_width = page_dict["width"]
+        batch.pages.append(page_index)
+        batch.texts.append(page_text(page_dict))
 
         for b in page_dict["blocks"]:
             if block_filter(b):
@@ -180,7 +232,7 @@ def load_text(pdf) -> list[Page]:
 
                 # collect_source_references(l, b, references)
 
-                score, features = calculate_line_score(bbox=b["bbox"], l=l)
+                first_span = l["spans"][0]
 
                 block_text_list.append("".join([s["text"] for s in l["spans"]]))
 
@@ -188,13 +240,30 @@ def load_text(pdf) -> list[Page]:
             if block_text_filter(block_text):
                 continue
 
-            chunk = Chunk(score=score, features=features, text=block_text)
+            batch.chunk_pages.append(page_index)
+            batch.chunk_indices.append(chunk_index)
+            batch.chunk_texts.append(block_text)
+            sizes.append(first_span["size"])
+            flags.append(first_span["flags"])
+            bboxes.append(b["bbox"])
+            page_sizes.append(page_size)
+            chunk_index += 1
+
+        if len(batch.pages) >= batch_size:
+            yield scored_batch()
+
+            batch = PageBatch()
+            sizes = []
+            flags = []
+            bboxes = []
+            page_sizes = []
 
-            page.chunks.append(chunk)
+    if len(batch.pages) > 0:
+        yield scored_batch()
 
-        results_pages.append(page)
 
-    return results_pages
+def load_text(pdf) -> list[PageBatch]:
+    return list(iter_text(pdf))
 
 
 def collapse_lines(pages):
@@ -244,47 +313,86 @@ def collapse_blocks(pages):
     return result_pages
 
 
-def export_blocks(output_base, document):
-    data = {
-        "page": [],
-        "chunk": [],
-        "score": [],
-        "size": [],
-        "bold": [],
-        "x": [],
-        "y": [],
-        "width": [],
-        "height": [],
-        "text": [],
-        "bbox": [],
-    }
+BLOCKS_SCHEMA = pa.schema(
+    [
+        ("page", pa.int32()),
+        ("chunk", pa.int32()),
+        ("score", pa.float64()),
+        ("size", pa.float64()),
+        ("bold", pa.bool_()),
+        ("x", pa.float64()),
+        ("y", pa.float64()),
+        ("width", pa.float64()),
+        ("height", pa.float64()),
+        ("superscript", pa.bool_()),
+        ("x_norm", pa.float64()),
+        ("y_norm", pa.float64()),
+        ("text", pa.string()),
+        ("bbox_x0", pa.float64()),
+        ("bbox_y0", pa.float64()),
+        ("bbox_x1", pa.float64()),
+        ("bbox_y1", pa.float64()),
+    ]
+)
+
+PAGE_TEXT_SCHEMA = pa.schema([("page", pa.int32()), ("text", pa.string())])
+
+# pages per batch, scored together and written as one row group; single-row
+# groups are slow to read
+PAGE_BATCH_SIZE = 1024
+
+
+def blocks_table(batch):
+    features = batch.features
+
+    return pa.table(
+        {
+            "page": batch.chunk_pages,
+            "chunk": batch.chunk_indices,
+            "score": features["score"],
+            "size": features["size"],
+            "bold": features["bold"],
+            "x": features["x"],
+            "y": features["y"],
+            "width": features["width"],
+            "height": features["height"],
+            "superscript": features["superscript"],
+            "x_norm": features["x_norm"],
+            "y_norm": features["y_norm"],
+            "text": batch.chunk_texts,
+            "bbox_x0": batch.bboxes[:, 0],
+            "bbox_y0": batch.bboxes[:, 1],
+            "bbox_x1": batch.bboxes[:, 2],
+            "bbox_y1": batch.bboxes[:, 3],
+        },
+        schema=BLOCKS_SCHEMA,
+    )
 
-    for page_index, page in enumerate(document):
-        for chunk_pos, chunk in enumerate(page.chunks):
-            data["page"].append(page_index)
-            data["chunk"].append(chunk_pos)
-            data["score"].append(chunk.score)
-            data["size"].append(chunk.features["size"])
-            data["bold"].append(chunk.features["bold"])
-            data["x"].append(chunk.features["x"])
-            data["y"].append(chunk.features["y"])
-            data["width"].append(chunk.features["width"])
-            data["height"].append(chunk.features["height"])
-            data["text"].append(chunk.text)
-            data["bbox"].append(chunk.features["bbox"])
 
-    output_path = output_base / "blocks.csv"
-    output_df = pd.DataFrame(data=data)
-    output_df.to_csv(output_path, index=None, quoting=csv.QUOTE_ALL)
+def export_blocks(output_base, document):
+    """Write the chunks and text of `document` to blocks/page_text.parquet.
+
+    `document` is any iterable of `PageBatch`, such as `iter_text(pdf)`. Each
+    batch is written as it comes, as one row group of each file, so only one
+    batch is held in memory. Returns the path of blocks.parquet.
+    """
+    blocks_path = output_base / "blocks.parquet"
+    page_text_path = output_base / "page_text.parquet"
 
-    return output_df
+    with pq.ParquetWriter(blocks_path, BLOCKS_SCHEMA) as blocks_writer:
+        with pq.ParquetWriter(page_text_path, PAGE_TEXT_SCHEMA) as page_text_writer:
+            for batch in document:
+                if len(batch.chunk_texts) > 0:
+                    blocks_writer.write_table(blocks_table(batch))
 
+                page_text_writer.write_table(
+                    pa.table(
+                        {"page": batch.pages, "text": batch.texts},
+                        schema=PAGE_TEXT_SCHEMA,
+                    )
+                )
 
-def export_page_text(output_base, document):
-    page_text_path = output_base / "page_text.csv"
-    page_text_data = [page.text for page in document]
-    page_text_df = pd.DataFrame(data=page_text_data)
-    page_text_df.to_csv(page_text_path, index=None, quoting=csv.QUOTE_ALL)
+    return blocks_path
 
 
 def export_misc(output_base, misc_df):
@@ -332,9 +440,7 @@ def process_file(input_path):
     should_export_blocks = True
 
     if should_export_blocks:
-        document = load_text(pdf)
-        blocks_df = export_blocks(output_base=output_base, document=document)
-        export_page_text(output_base=output_base, document=document)
+        blocks_path = export_blocks(output_base=output_base, document=iter_text(pdf))
         export_misc(output_base=output_base, misc_df=misc_df)
 
     create_page_annotations = False
@@ -343,7 +449,7 @@ def process_file(input_path):
         pdf_bytes = input_path.read_bytes()
 
         annotator.annotate_from_df(
-            blocks_df=blocks_df,
+            blocks_df=pd.read_parquet(blocks_path),
             pdf_path=input_path,
             pdf_bytes=pdf_bytes,
             output_path=output_base / "annotations",
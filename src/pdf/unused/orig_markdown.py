@@ -35,10 +35,16 @@ Copyright 2024 Artifex Software, Inc.
 License GNU Affero GPL 3.0
 """
 
+import io
 import string
 
 import fitz
 
+from utils.links import LinkIndex
+from utils.markdown_writer import MarkdownWriter
+from utils.span_cache import RawDictTextPage, SpanCache
+from utils.tables import find_tables
+
 
 class IdentifyHeaders:
     """Compute data for identifying header text."""
@@ -94,20 +100,13 @@ class IdentifyHeaders:
         return hdr_id
 
 
-def resolve_links(links, span):
-    """Accept a span bbox and return a markdown link string."""
-    bbox = fitz.Rect(span["bbox"])  # span bbox
-    # a link should overlap at least 70% of the span
-    bbox_area = 0.7 * abs(bbox)
-    for link in links:
-        hot = link["from"]  # the hot area of the link
-        if not abs(hot & bbox) >= bbox_area:
-            continue  # does not touch the bbox
-        text = f'[{span["text"].strip()}]({link["uri"]})'
-        return text
+def ends_with_newline(fragments) -> bool:
+    return len(fragments) > 0 and fragments[-1].endswith("\n")
 
 
-def write_text(page, clip, hdr_prefix):
+def write_text(
+    page, clip, hdr_prefix, link_index=None, span_cache=None, table_rects=()
+):
     """Output the text found inside the given clip.
 
     This is an alternative for plain text in that it outputs
@@ -116,19 +115,25 @@ def write_text(page, clip, hdr_prefix):
     inline code, bold, italic and bold-italic styling.
     There is also some effort for list supported (ordered / unordered) in
     that typical characters are replaced by respective markdown characters.
+    With a `span_cache` of the page, the lines intersecting the clip and not
+    inside one of `table_rects` are taken from it rather than extracted again.
     """
-    out_string = ""
+    out = []  # fragments, joined once at the end
     code = False  # mode indicator: outputting code
 
-    # extract URL type links on page
-    links = [l for l in page.get_links() if l["kind"] == 2]
+    # extract URL type links on page, unless the caller already did
+    if link_index is None:
+        link_index = LinkIndex.from_page(page)
 
-    blocks = page.get_text(
-        "dict",
-        clip=clip,
-        flags=fitz.TEXTFLAGS_TEXT,
-        sort=True,
-    )["blocks"]
+    if span_cache is not None:
+        blocks = span_cache.clip(clip, exclude=table_rects)
+    else:
+        blocks = page.get_text(
+            "dict",
+            clip=clip,
+            flags=fitz.TEXTFLAGS_TEXT,
+            sort=True,
+        )["blocks"]
 
     for block in blocks:  # iterate textblocks
         previous_y = 0
@@ -142,8 +147,11 @@ def write_text(page, clip, hdr_prefix):
             # check for still being on same line
             same_line = abs(this_y - previous_y) <= 3 and previous_y > 0
 
-            if same_line and out_string.endswith("\n"):
-                out_string = out_string[:-1]
+            if same_line and ends_with_newline(out):
+                out[-1] = out[-1][:-1]
+
+                if out[-1] == "":
+                    out.pop()
 
             # are all spans in line in a mono-spaced font?
             all_mono = all([s["flags"] & 8 for s in spans])
@@ -152,8 +160,8 @@ def write_text(page, clip, hdr_prefix):
             text = "".join([s["text"] for s in spans])
             if not same_line:
                 previous_y = this_y
-                if not out_string.endswith("\n"):
-                    out_string += "\n"
+                if not ends_with_newline(out):
+                    out.append("\n")
 
             if all_mono:
                 # compute approx. distance from left - assuming a width
@@ -162,19 +170,19 @@ def write_text(page, clip, hdr_prefix):
                     (spans[0]["bbox"][0] - block["bbox"][0]) / (spans[0]["size"] * 0.5)
                 )
                 if not code:  # if not already in code output  mode:
-                    out_string += "```"  # switch on "code" mode
+                    out.append("```")  # switch on "code" mode
                     code = True
                 if not same_line:  # new code line with left indentation
-                    out_string += "\n" + " " * delta + text + " "
+                    out.append("\n" + " " * delta + text + " ")
                     previous_y = this_y
                 else:  # same line, simply append
-                    out_string += text + " "
+                    out.append(text + " ")
                 continue  # done with this line
 
             for i, s in enumerate(spans):  # iterate spans of the line
                 # this line is not all-mono, so switch off "code" mode
                 if code:  # still in code output mode?
-                    out_string += "```\n"  # switch of code mode
+                    out.append("```\n")  # switch of code mode
                     code = False
                 # decode font properties
                 mono = s["flags"] & 8
@@ -183,7 +191,7 @@ def write_text(page, clip, hdr_prefix):
 
                 if mono:
                     # this is text in some monospaced font
-                    out_string += f"`{s['text'].strip()}` "
+                    out.append(f"`{s['text'].strip()}` ")
                 else:  # not a mono text
                     # for first span, get header prefix string if present
                     if i == 0:
@@ -200,7 +208,7 @@ def write_text(page, clip, hdr_prefix):
                             prefix += "_"
                             suffix = "_" + suffix
 
-                    ltext = resolve_links(links, s)
+                    ltext = link_index.resolve(s)
                     if ltext:
                         text = f"{hdr_string}{prefix}{ltext}{suffix} "
                     else:
@@ -213,15 +221,15 @@ def write_text(page, clip, hdr_prefix):
                         .replace(chr(8226), "-")
                         .replace(chr(9679), "-")
                     )
-                    out_string += text
+                    out.append(text)
             previous_y = this_y
             if not code:
-                out_string += "\n"
-        out_string += "\n"
+                out.append("\n")
+        out.append("\n")
     if code:
-        out_string += "```\n"  # switch of code mode
+        out.append("```\n")  # switch of code mode
         code = False
-    return out_string.replace(" \n", "\n")
+    return "".join(out).replace(" \n", "\n")
 
 
 def to_markdown(doc: fitz.Document, pages: list = None) -> str:
@@ -234,20 +242,32 @@ def to_markdown(doc: fitz.Document, pages: list = None) -> str:
     if not pages:  # use all pages if argument not given
         pages = range(doc.page_count)
 
+    # only the font size histogram is kept from this pass
     hdr_prefix = IdentifyHeaders(doc, pages=pages)
-    md_string = ""
+    output = io.StringIO()
+    writer = MarkdownWriter(output, separator="")
 
     for pno in pages:
-        page = doc[pno]
+        # extracted once for all text rectangles and the table prefilter
+        span_cache = SpanCache(doc[pno])
+        page = span_cache.page
+        link_index = LinkIndex.from_page(page)
         # 1. first locate all tables on page
-        tabs = page.find_tables()
+        tabs = find_tables(page, line_bboxes=span_cache.line_bboxes())
+
+        if len(tabs) > 0:
+            # the tables of a page share one text page
+            textpage = RawDictTextPage(tabs[0].textpage)
+
+            for tab in tabs:
+                tab.textpage = textpage
 
         # 2. make a list of table boundary boxes, sort by top-left corner.
         # Must include the header bbox, which may be external.
         tab_rects = sorted(
             [
                 (fitz.Rect(t.bbox) | fitz.Rect(t.header.bbox), i)
-                for i, t in enumerate(tabs.tables)
+                for i, t in enumerate(tabs)
             ],
             key=lambda r: (r[0].y0, r[0].x0),
         )
@@ -295,14 +315,25 @@ def to_markdown(doc: fitz.Document, pages: list = None) -> str:
         # we have all rectangles and can start outputting their contents
         for rtype, r, idx in text_rects:
             if rtype == "text":  # a text rectangle
-                md_string += write_text(page, r, hdr_prefix)  # write MD content
-                md_string += "\n"
+                writer.write(
+                    write_text(
+                        page,
+                        r,
+                        hdr_prefix,
+                        link_index,
+                        span_cache,
+                        [tab_rect for tab_rect, _ in tab_rects],
+                    )
+                )
+                writer.write("\n")
             else:  # a table rect
-                md_string += tabs[idx].to_markdown(clean=False)
+                writer.write(tabs[idx].to_markdown(clean=False))
+
+        writer.write("\n-----\n\n")
 
-        md_string += "\n-----\n\n"
+    writer.flush()
 
-    return md_string
+    return output.getvalue()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
+import io
 from collections import Counter
 from pathlib import Path
 from pprint import pprint
@@ -5,6 +6,11 @@ from pprint import pprint
 from pptx import Presentation
 
 from utils import text_skipping
+from utils.conversion_cache import ConversionCache
+from utils.instrumentation import NULL_RECORDER
+from utils.markdown_writer import MarkdownWriter
+
+CONVERTER_VERSION = "1"
 
 
 def calculate_col_char_widths(table):
@@ -59,18 +65,27 @@ def table_to_markdown(table):
     return table_lines
 
 
-def to_markdown(input_file):
-    presentation = Presentation(input_file)
+def write_markdown(input_file, output, skip_counter, recorder=NULL_RECORDER):
+    """Write the Markdown for `input_file` to `output` slide by slide.
 
-    lines = []
-    skip_counter = Counter()
+    `output` is a text stream or a `MarkdownWriter`.
+    """
+    with recorder.stage("ppt.load"):
+        presentation = Presentation(input_file)
+
+    writer = output
+
+    if not isinstance(writer, MarkdownWriter):
+        writer = MarkdownWriter(output, separator="\n")
 
     for presentation_i, slide in enumerate(presentation.slides):
-        lines.append(f"Slide number: {presentation_i+1}")
-        lines.append(f"Slide id: {slide.slide_id}")
+        recorder.count("ppt.slides")
+
+        writer.paragraph(f"Slide number: {presentation_i+1}")
+        writer.paragraph(f"Slide id: {slide.slide_id}")
 
         if slide.has_notes_slide:
-            lines.append(slide.notes_slide())
+            writer.paragraph(slide.notes_slide())
 
         for shape in slide.shapes:
             if shape.has_text_frame:
@@ -81,27 +96,44 @@ def to_markdown(input_file):
                         skip_counter[text] += 1
                         continue
 
-                    lines.append(text)
+                    writer.paragraph(text)
 
             # | Syntax      | Description |
             # | ----------- | ----------- |
             # | Header      | Title       |
             # | Paragraph   | Text        |
             if shape.has_table:
-                lines += table_to_markdown(shape.table)
+                with recorder.stage("ppt.table_to_markdown"):
+                    writer.table(table_to_markdown(shape.table))
+
+                recorder.count("ppt.tables")
 
         for placeholder in slide.placeholders:
-            lines.append(placeholder.text)
+            writer.paragraph(placeholder.text)
             # print(placeholder.shape_type)
             # print(placeholder.text)
             # print(placeholder.text_frame)
             # print(placeholder.has_chart)
 
-        lines += "\n"
+        writer.write("\n")
+
+    writer.flush()
+
+    recorder.count("ppt.lines", writer.blocks)
+
+
+def to_markdown(input_file, recorder=NULL_RECORDER):
+    skip_counter = Counter()
+
+    output = io.StringIO()
+
+    write_markdown(input_file, output, skip_counter, recorder=recorder)
+
+    recorder.count("ppt.skipped", sum(skip_counter.values()))
 
     pprint(skip_counter)
 
-    return "\n".join(lines)
+    return output.getvalue()
 
 
 def _main():
@@ -109,10 +141,17 @@ def _main():
     data_dir = base_dir / "data"
     input_file = data_dir / "sample.pptx"
 
-    output = to_markdown(input_file=input_file)
-
     output_dir = base_dir / "output"
     output_dir.mkdir(parents=True, exist_ok=True)
+
+    cache = ConversionCache(output_dir / "cache")
+    output = cache.markdown(
+        input_file,
+        converter="ppt",
+        version=CONVERTER_VERSION,
+        convert=lambda: to_markdown(input_file=input_file),
+    )
+
     output_file = output_dir / f"{input_file.name}.md"
     output_file.write_text(output)
 
@@ -8,25 +8,40 @@ from markdownify import markdownify
 from bs4 import BeautifulSoup
 
 from utils import text_skipping
+from utils.conversion_cache import ConversionCache
+from utils.instrumentation import NULL_RECORDER
 
+CONVERTER_VERSION = "1"
 
-def to_html(input_file):
-    parsed = parser.from_file(str(input_file), xmlContent=True)
+
+def to_html(input_file, recorder=NULL_RECORDER):
+    with recorder.stage("tika.parse"):
+        parsed = parser.from_file(str(input_file), xmlContent=True)
     result = parsed["content"]
 
     return result
 
 
-def clean_html(html):
-    soup = BeautifulSoup(html, features="lxml", preserve_whitespace_tags=["p"])
+def clean_html(html, recorder=NULL_RECORDER):
+    with recorder.stage("tika.soup_parse"):
+        soup = BeautifulSoup(html, features="lxml", preserve_whitespace_tags=["p"])
+
+    with recorder.stage("tika.skip_filter"):
+        elements = soup.find_all()
+        should_skip = text_skipping.should_skip_many([x.text.strip() for x in elements])
 
-    for x in soup.find_all():
+    recorder.count("tika.elements", len(elements))
+    recorder.count("tika.skipped", sum(should_skip))
+
+    for x, skip in zip(elements, should_skip):
         # if x.name in ["html", "body", "head", "meta", "div"]:
         #     continue
 
-        text = x.text.strip()
+        if x.decomposed:
+            # already removed along with a skipped ancestor
+            continue
 
-        if text_skipping.should_skip(text):
+        if skip:
             # if (
             #     x.text.startswith("0")
             # or x.name == "div"
@@ -43,16 +58,18 @@ def clean_html(html):
     #     text = x.text.strip()
     #     x.string = text
 
-    soup.smooth()
-    clean = soup.prettify()  # "utf-8", formatter="minimal")
+    with recorder.stage("tika.prettify"):
+        soup.smooth()
+        clean = soup.prettify()  # "utf-8", formatter="minimal")
 
     # clean = str(clean)
 
     return clean
 
 
-def to_markdown(html):
-    markdown = markdownify(html, strip=["meta"])
+def to_markdown(html, recorder=NULL_RECORDER):
+    with recorder.stage("tika.markdownify"):
+        markdown = markdownify(html, strip=["meta"])
 
     return markdown
 
@@ -61,6 +78,8 @@ def _main():
     base_dir = Path(__file__).parents[2]
     data_dir = base_dir / "data"
 
+    cache = ConversionCache(base_dir / "output" / "cache")
+
     for input_file in tqdm(
         [
             data_dir / "JPM Electravision 14th Annual Energy Paper 20240305.pdf",
@@ -68,9 +87,16 @@ def _main():
             data_dir / "sample.pptx",
         ]
     ):
-        html = to_html(input_file)
-        cleaned_html = clean_html(html)
-        markdown = to_markdown(cleaned_html)
+        key = cache.key(input_file, converter="tika", version=CONVERTER_VERSION)
+        cached = cache.get_records(key)
+
+        if cached is None:
+            html = to_html(input_file)
+            cleaned_html = clean_html(html)
+            markdown = to_markdown(cleaned_html)
+            cache.put_records(key, (html, cleaned_html, markdown))
+        else:
+            html, cleaned_html, markdown = cached
 
         output_dir = base_dir / "output" / "tika"
         output_dir.mkdir(parents=True, exist_ok=True)
@@ -1,10 +1,15 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 
 import fitz
-from pdf2image import convert_from_bytes
+import numpy as np
 from PIL import ImageDraw
 from tqdm import tqdm
 
+from utils.tables import find_tables
+
 
 def rect_intersection(a, b):
     x1 = max(min(a[0], a[2]), min(b[0], b[2]))
@@ -15,87 +20,242 @@ def rect_intersection(a, b):
     return x1 < x2 and y1 < y2
 
 
-def annotate_from_bytes(pdf_bytes, output_path):
-    pdf = fitz.open(stream=pdf_bytes)
-    images = convert_from_bytes(pdf_bytes)
+def _block_rects(page):
+    return [b["bbox"] for b in page.get_text("dict", sort=False)["blocks"]]
 
-    output_path.mkdir(exist_ok=True, parents=True)
 
-    pages = list(zip(pdf.pages(), images))
+def _mediabox_rects(page):
+    return [page.mediabox]
 
-    for page_num, (page, image) in enumerate(tqdm(pages)):
-        page_w = page.rect[2]
-        page_h = page.rect[3]
 
-        blocks = page.get_text("dict", sort=False)["blocks"]
+def _table_rects(page):
+    return [table.bbox for table in find_tables(page)]
 
-        draw = ImageDraw.Draw(image)
 
-        for b in blocks:
-            bbox = scale_rect(
-                from_size=image.size, from_rect=b["bbox"], to_size=(page_w, page_h)
-            )
+def _drawing_rects(page):
+    return [drawing["rect"] for drawing in page.get_drawings()]
+
+
+def _image_rects(page):
+    return [image["bbox"] for image in page.get_image_info()]
+
+
+# overlay name -> (rects of the page to outline, outline color, outline width)
+OVERLAYS = {
+    "blocks": (_block_rects, "red", 1),
+    "mediabox": (_mediabox_rects, "yellow", 10),
+    "cluster_drawings": (lambda page: page.cluster_drawings(), "purple", 10),
+    "tables": (_table_rects, "green", 10),
+    "drawings": (_drawing_rects, "blue", 1),
+    "images": (_image_rects, "cyan", 10),
+}
+
+DEFAULT_OVERLAYS = ("blocks", "mediabox", "cluster_drawings")
 
-            draw.rectangle(bbox, outline="red", width=1)
 
-        scaled_mediabox = scale_rect(
-            from_size=image.size,
-            from_rect=page.mediabox,
-            to_size=(page_w, page_h),
-        )
-        draw.rectangle(scaled_mediabox, outline="yellow", width=10)
+def annotate_page(page, output_path, overlays=DEFAULT_OVERLAYS, dpi=200):
+    """Render `page` at `dpi`, outline the `overlays` on it and save it as PNG."""
+    image = page.get_pixmap(dpi=dpi).pil_image()
 
-        for cluster_drawing in page.cluster_drawings():
-            scaled_cluster_drawings = scale_rect(
+    page_w = page.rect[2]
+    page_h = page.rect[3]
+
+    draw = ImageDraw.Draw(image)
+
+    for overlay in overlays:
+        get_rects, color, width = OVERLAYS[overlay]
+
+        for rect in get_rects(page):
+            # rotated text blocks come with inverted bboxes
+            scaled_rect = scale_rect(
                 from_size=image.size,
-                from_rect=cluster_drawing,
+                from_rect=fitz.Rect(rect).normalize(),
                 to_size=(page_w, page_h),
             )
-            draw.rectangle(scaled_cluster_drawings, outline="purple", width=10)
-
-        # for table in page.find_tables():
-        #     scaled_table = scale_rect(
-        #         from_size=image.size,
-        #         from_rect=table.bbox,
-        #         to_size=(page_w, page_h),
-        #     )
-        #     draw.rectangle(scaled_table, outline="red", width=10)
-
-        # for drawing in page.get_drawings():
-        #     scaled_drawing = scale_rect(
-        #         from_size=image.size,
-        #         from_rect=drawing["rect"],
-        #         to_size=(page_w, page_h),
-        #     )
-        #     draw.rectangle(scaled_drawing, outline="blue", width=1)
-
-        # for pixmap in page.get_images():
-        #     image_rect = (
-        #         pixmap[0],
-        #         pixmap[1],
-        #         pixmap[0] + pixmap[2],
-        #         pixmap[1] + pixmap[3],
-        #     )
-        #     scaled_image = scale_rect(
-        #         from_size=image.size,
-        #         from_rect=image_rect,
-        #         to_size=(page_w, page_h),
-        #     )
-        #     draw.rectangle(scaled_image, outline="cyan", width=10)
-
-        # for item_text, item_rect, item_type in drawing["items"]:
-        #     scaled_item = scale_rect(
-        #         from_size=image.size,
-        #         from_rect=item_rect,
-        #         to_size=(page_w, page_h),
-        #     )
-        #     draw.rectangle(scaled_item, outline="green", width=1)
-
-        image.save(output_path / f"{page_num}.png", "PNG")
+            draw.rectangle(scaled_rect, outline=color, width=width)
+
+    image.save(output_path / f"{page.number}.png", "PNG")
+
+
+def annotate_blocks(page, output_path, bboxes, colors, dpi=200, width=2):
+    """Render `page` at `dpi`, outline `bboxes` in `colors` and save it as PNG.
+
+    `bboxes` is an (n, 4) array of PDF coordinates and `colors` an (n, 3)
+    array of RGB values; both are scaled and normalized as whole arrays.
+    """
+    image = page.get_pixmap(dpi=dpi).pil_image()
+
+    scale = np.array(
+        [image.width / page.rect[2], image.height / page.rect[3]] * 2, dtype=float
+    )
+    rects = np.asarray(bboxes, dtype=float).reshape(-1, 4) * scale
+    # rotated text blocks come with inverted bboxes
+    rects = np.hstack(
+        [np.minimum(rects[:, :2], rects[:, 2:]), np.maximum(rects[:, :2], rects[:, 2:])]
+    )
+
+    draw = ImageDraw.Draw(image)
+
+    for rect, color in zip(rects.tolist(), np.asarray(colors).tolist()):
+        draw.rectangle(rect, outline=tuple(color), width=width)
+
+    image.save(output_path / f"{page.number}.png", "PNG")
+
+
+def _open_pdf(pdf_source):
+    if isinstance(pdf_source, bytes):
+        return fitz.open(stream=pdf_source)
+
+    return fitz.open(pdf_source)
+
+
+def _shards(items, workers):
+    count = len(items)
+    shard_count = min(count, workers * 4) or 1
+    shard_size = -(-count // shard_count)
+
+    return [items[start : start + shard_size] for start in range(0, count, shard_size)]
+
+
+def _run_shards(shard_function, shards, args, workers):
+    """Call `shard_function(shard, *args)` per shard, showing pages done."""
+    with tqdm(total=sum([len(shard) for shard in shards])) as progress:
+        if workers == 1:
+            for shard in shards:
+                progress.update(shard_function(shard, *args))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for annotated in executor.map(
+                    shard_function, shards, *[repeat(arg) for arg in args]
+                ):
+                    progress.update(annotated)
+
+
+def _annotate_shard(page_numbers, pdf_source, output_path, overlays, dpi):
+    with _open_pdf(pdf_source) as pdf:
+        for page_number in page_numbers:
+            annotate_page(pdf.load_page(page_number), output_path, overlays, dpi)
+
+    return len(page_numbers)
+
+
+def annotate(
+    pdf_source,
+    output_path,
+    overlays=DEFAULT_OVERLAYS,
+    dpi=200,
+    workers=1,
+    page_numbers=None,
+):
+    """Save a PNG per page of `pdf_source` (a path or PDF bytes) with overlays.
+
+    `overlays` names entries of `OVERLAYS`; `cluster_drawings` is the
+    expensive one. Pages are rendered one at a time with PyMuPDF, so each
+    worker only holds the image of the page it is drawing. With several
+    `workers`, pages are split into contiguous shards and every worker opens
+    its own document.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    overlays = tuple(overlays)
+    unknown = set(overlays) - OVERLAYS.keys()
+
+    if unknown:
+        raise ValueError(f"Unknown overlays: {sorted(unknown)}")
+
+    if page_numbers is None:
+        with _open_pdf(pdf_source) as pdf:
+            page_numbers = range(pdf.page_count)
+
+    output_path.mkdir(exist_ok=True, parents=True)
+
+    _run_shards(
+        _annotate_shard,
+        _shards(list(page_numbers), workers),
+        (pdf_source, output_path, overlays, dpi),
+        workers,
+    )
+
+    return output_path
+
+
+def _annotate_blocks_shard(pages, pdf_source, output_path, dpi):
+    with _open_pdf(pdf_source) as pdf:
+        for page_number, bboxes, colors in pages:
+            page = pdf.load_page(page_number)
+            annotate_blocks(page, output_path, bboxes, colors, dpi=dpi)
+
+    return len(pages)
+
+
+def value_colors(values):
+    """Map `values` linearly from blue (lowest) to red (highest) RGB colors."""
+    values = np.asarray(values, dtype=float)
+    low, high = np.nanmin(values), np.nanmax(values)
+    t = (values - low) / (high - low) if high > low else np.zeros_like(values)
+    t = np.nan_to_num(t)
+
+    return np.stack([255 * t, np.zeros_like(t), 255 * (1 - t)], axis=1).astype(np.uint8)
+
+
+def annotate_from_df(
+    blocks_df,
+    output_path,
+    pdf_path=None,
+    pdf_bytes=None,
+    color_by="score",
+    dpi=200,
+    workers=1,
+):
+    """Save a PNG per page in `blocks_df` with its blocks outlined.
+
+    `blocks_df` is the frame `export_blocks` writes, with a `page` column and
+    the bbox as `bbox_x0`, `bbox_y0`, `bbox_x1` and `bbox_y1`. Each block is
+    colored by its `color_by` column (the score, or a feature such as `size`
+    or `bold`) from blue for the lowest value in the frame to red for the
+    highest, so colors compare across pages. The PDF is read from
+    `pdf_bytes` when given, else from `pdf_path`. A frame without blocks
+    saves nothing.
+    """
+    output_path.mkdir(exist_ok=True, parents=True)
+
+    if len(blocks_df) == 0:
+        return output_path
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    pdf_source = pdf_bytes if pdf_bytes is not None else str(pdf_path)
+
+    page_numbers = blocks_df["page"].to_numpy()
+    bboxes = blocks_df[["bbox_x0", "bbox_y0", "bbox_x1", "bbox_y1"]].to_numpy(float)
+    colors = value_colors(blocks_df[color_by].to_numpy())
+
+    # rows of each page, in page order, without a Python loop over blocks
+    order = np.argsort(page_numbers, kind="stable")
+    pages, starts = np.unique(page_numbers[order], return_index=True)
+    page_rows = np.split(order, starts[1:])
+
+    pages = [
+        (int(page_number), bboxes[rows], colors[rows])
+        for page_number, rows in zip(pages, page_rows)
+    ]
+
+    _run_shards(
+        _annotate_blocks_shard,
+        _shards(pages, workers),
+        (pdf_source, output_path, dpi),
+        workers,
+    )
 
     return output_path
 
 
+def annotate_from_bytes(pdf_bytes, output_path, **kwargs):
+    return annotate(pdf_bytes, output_path, **kwargs)
+
+
 def scale_rect(from_rect, from_size, to_size):
     from_w, from_h = from_size
     to_w, to_h = to_size
@@ -110,9 +270,9 @@ def scale_rect(from_rect, from_size, to_size):
     return bbox
 
 
-def annotate_from_file(file_path, output_path):
-    pdf_bytes = file_path.read_bytes()
-    annotate_from_bytes(pdf_bytes=pdf_bytes, output_path=output_path)
+def annotate_from_file(file_path, output_path, **kwargs):
+    # workers open the file themselves rather than receiving its bytes
+    return annotate(str(file_path), output_path, **kwargs)
 
 
 def main():
@@ -123,7 +283,7 @@ def main():
     )
     output_path = Path(__file__).parents[2] / "output" / Path(pdf_path).name
 
-    annotate_from_file(file_path=pdf_path, output_path=output_path)
+    annotate_from_file(file_path=pdf_path, output_path=output_path, workers=None)
 
 
 if __name__ == "__main__":
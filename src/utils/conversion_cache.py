@@ -0,0 +1,167 @@
+import contextlib
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from pathlib import Path
+
+
+class ConversionCache:
+    """Content-addressed on-disk store for converter output.
+
+    Entries are keyed by the SHA-256 of the input bytes plus the converter
+    name, converter version and options, so a renamed file still hits and an
+    edited one misses. Files are touched on every read and the least recently
+    used entries are evicted once the store grows past `max_bytes`. Several
+    processes may share one cache directory: an entry another process evicts
+    meanwhile is a miss.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024**3):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.total_bytes = sum(stat.st_size for stat, _ in self._stat_entries())
+        self._digests = {}
+
+    def file_digest(self, input_file):
+        stat = os.stat(input_file)
+        digest_key = (str(input_file), stat.st_size, stat.st_mtime_ns)
+
+        if digest_key not in self._digests:
+            digest = hashlib.sha256()
+
+            with open(input_file, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+
+            self._digests[digest_key] = digest.hexdigest()
+
+        return self._digests[digest_key]
+
+    def key(self, input_file, converter, version, options=None):
+        return self.content_key(
+            self.file_digest(input_file), converter, version, options
+        )
+
+    def content_key(self, digest, converter, version, options=None):
+        """Like `key`, but for content already digested, e.g. a single page."""
+        key_data = {
+            "input": digest,
+            "converter": converter,
+            "version": version,
+            "options": options or {},
+        }
+        key_json = json.dumps(key_data, sort_keys=True, default=str)
+
+        return hashlib.sha256(key_json.encode()).hexdigest()
+
+    def get_markdown(self, key):
+        return self._read(key, ".md", Path.read_text)
+
+    def put_markdown(self, key, markdown):
+        data = markdown.encode()
+        self._write(key, ".md", lambda tmp_path: tmp_path.write_bytes(data))
+
+    def get_records(self, key):
+        return self._read(key, ".pkl", lambda path: pickle.loads(path.read_bytes()))
+
+    def put_records(self, key, records):
+        data = pickle.dumps(records, pickle.HIGHEST_PROTOCOL)
+        self._write(key, ".pkl", lambda tmp_path: tmp_path.write_bytes(data))
+
+    def markdown(self, input_file, converter, version, convert, options=None):
+        """Return the cached Markdown for `input_file`, calling `convert` on a miss."""
+        key = self.key(input_file, converter, version, options)
+        markdown = self.get_markdown(key)
+
+        if markdown is None:
+            markdown = convert()
+            self.put_markdown(key, markdown)
+
+        return markdown
+
+    def markdown_file(
+        self, input_file, output_file, converter, version, write, options=None
+    ):
+        """Like `markdown`, but stream the Markdown into `output_file`.
+
+        On a miss `write(output)` writes the Markdown to `output_file` opened
+        for text, which is then copied into the cache; a hit is copied out of
+        it. The Markdown is never held in memory as a whole.
+        """
+        key = self.key(input_file, converter, version, options)
+
+        if self._read(key, ".md", lambda path: shutil.copyfile(path, output_file)):
+            return
+
+        with open(output_file, "w") as output:
+            write(output)
+
+        self._write(key, ".md", lambda tmp_path: shutil.copyfile(output_file, tmp_path))
+
+    def evict(self, target_bytes=None):
+        if target_bytes is None:
+            target_bytes = self.max_bytes
+
+        entries = sorted(self._stat_entries(), key=lambda entry: entry[0].st_mtime)
+
+        self.total_bytes = sum(stat.st_size for stat, _ in entries)
+
+        for stat, path in entries:
+            if self.total_bytes <= target_bytes:
+                break
+
+            path.unlink(missing_ok=True)
+            self.total_bytes -= stat.st_size
+
+    def _path(self, key, suffix):
+        return self.cache_dir / key[:2] / f"{key}{suffix}"
+
+    def _entries(self):
+        return [path for path in self.cache_dir.glob("*/*") if path.suffix != ".tmp"]
+
+    def _stat_entries(self):
+        """Return `(stat, path)` for each entry still there once listed."""
+        entries = []
+
+        for path in self._entries():
+            with contextlib.suppress(FileNotFoundError):
+                entries.append((path.stat(), path))
+
+        return entries
+
+    def _read(self, key, suffix, read):
+        """Return `read(path)` for the entry, or None when there is none."""
+        path = self._path(key, suffix)
+
+        try:
+            result = read(path)
+        except FileNotFoundError:
+            return None
+
+        # reads count as use for LRU eviction
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+
+        return result
+
+    def _write(self, key, suffix, write):
+        """Store an entry, `write(tmp_path)` writing its content to a temporary file."""
+        path = self._path(key, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with contextlib.suppress(FileNotFoundError):
+            self.total_bytes -= path.stat().st_size
+
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        write(tmp_path)
+        size = tmp_path.stat().st_size
+        os.replace(tmp_path, path)
+
+        self.total_bytes += size
+
+        if self.total_bytes > self.max_bytes:
+            # evict below the limit so the next few writes don't rescan
+            self.evict(target_bytes=int(self.max_bytes * 0.9))
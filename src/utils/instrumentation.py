@@ -0,0 +1,118 @@
+import json
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+
+class Recorder:
+    """Collects per-stage durations and named counts for one conversion.
+
+    Converters wrap their hot stages in `stage(name)` and report sizes with
+    `count(name, n)`. The result exports as JSON or as a Prometheus textfile
+    for the node exporter's textfile collector.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.stage_seconds = Counter()
+        self.stage_calls = Counter()
+        self.counts = Counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] += time.perf_counter() - start
+            self.stage_calls[name] += 1
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    def merge(self, other):
+        self.stage_seconds.update(other.stage_seconds)
+        self.stage_calls.update(other.stage_calls)
+        self.counts.update(other.counts)
+
+        return self
+
+    @classmethod
+    def from_dict(cls, data):
+        recorder = cls()
+
+        for name, stage in data["stages"].items():
+            recorder.stage_seconds[name] = stage["seconds"]
+            recorder.stage_calls[name] = stage["calls"]
+
+        recorder.counts.update(data["counts"])
+
+        return recorder
+
+    def to_dict(self):
+        return {
+            "stages": {
+                name: {"seconds": seconds, "calls": self.stage_calls[name]}
+                for name, seconds in self.stage_seconds.items()
+            },
+            "counts": dict(self.counts),
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self, prefix="markdown_converter", labels=None):
+        labels = labels or {}
+        lines = []
+
+        metrics = [
+            ("stage_seconds_total", "stage", self.stage_seconds),
+            ("stage_calls_total", "stage", self.stage_calls),
+            ("count_total", "name", self.counts),
+        ]
+
+        for metric, label_name, values in metrics:
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+
+            for name, value in sorted(values.items()):
+                label_text = _format_labels({**labels, label_name: name})
+                lines.append(f"{prefix}_{metric}{{{label_text}}} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, prefix="markdown_converter", labels=None):
+        # write then rename so the collector never reads a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+
+        with open(tmp_path, "w") as f:
+            f.write(self.to_prometheus(prefix=prefix, labels=labels))
+
+        os.replace(tmp_path, path)
+
+
+class NullRecorder(Recorder):
+    """A recorder that records nothing, the default for every converter."""
+
+    enabled = False
+
+    def stage(self, name):
+        return nullcontext()
+
+    def count(self, name, n=1):
+        pass
+
+    def merge(self, other):
+        return self
+
+
+NULL_RECORDER = NullRecorder()
+
+
+def _format_labels(labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return ",".join(f'{key}="{escape(value)}"' for key, value in labels.items())
@@ -0,0 +1,68 @@
+from collections import defaultdict
+from math import floor
+
+import fitz
+
+
+class LinkIndex:
+    """Grid index over the URI links of one page, for looking up spans.
+
+    Each link is filed under every `cell_size` square its hot area touches,
+    so a span only checks the few links near it instead of every link on the
+    page. Fetch the links once per page with `from_page` and query the index
+    for every span.
+    """
+
+    def __init__(self, links, cell_size=64.0):
+        self.links = links
+        self.cell_size = cell_size
+        self._cells = defaultdict(list)
+
+        for link_index, link in enumerate(links):
+            for key in self._keys(link["from"]):
+                self._cells[key].append(link_index)
+
+    @classmethod
+    def from_page(cls, page, cell_size=64.0):
+        links = [l for l in page.get_links() if l["kind"] == fitz.LINK_URI]
+
+        return cls(links, cell_size=cell_size)
+
+    def _keys(self, bbox):
+        x0, y0, x1, y1 = bbox
+        size = self.cell_size
+
+        return [
+            (x, y)
+            for x in range(floor(min(x0, x1) / size), floor(max(x0, x1) / size) + 1)
+            for y in range(floor(min(y0, y1) / size), floor(max(y0, y1) / size) + 1)
+        ]
+
+    def find(self, bbox, min_overlap=0.7) -> int:
+        """Return the index of the first link covering `min_overlap` of `bbox`, or -1."""
+        if len(self.links) == 0:
+            return -1
+
+        candidates = {
+            link_index
+            for key in self._keys(bbox)
+            for link_index in self._cells.get(key, ())
+        }
+
+        span_rect = fitz.Rect(bbox)
+        min_area = min_overlap * abs(span_rect)
+
+        for link_index in sorted(candidates):
+            if abs(self.links[link_index]["from"] & span_rect) >= min_area:
+                return link_index
+
+        return -1
+
+    def resolve(self, span):
+        """Return `span` as a Markdown link if a link covers it, else None."""
+        link_index = self.find(span["bbox"])
+
+        if link_index < 0:
+            return None
+
+        return f'[{span["text"].strip()}]({self.links[link_index]["uri"]})'
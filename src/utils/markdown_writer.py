@@ -0,0 +1,54 @@
+class MarkdownWriter:
+    """Streams Markdown blocks to `output` as a converter emits them.
+
+    Blocks (paragraphs, tables, whole pages, ...) are joined by `separator`
+    and buffered as fragments until `buffer_size` characters are pending, then
+    written out in one go. The output starts before the conversion ends and
+    only the pending fragments are held in memory. `output` is anything with
+    `write(str)`: an open file, `sys.stdout`, `socket.makefile("w")` or an
+    `io.StringIO`.
+    """
+
+    def __init__(self, output, separator="\n", buffer_size=64 * 1024):
+        self.output = output
+        self.separator = separator
+        self.buffer_size = buffer_size
+        self.blocks = 0
+        self._fragments = []
+        self._pending = 0
+
+    def write(self, text):
+        if self.blocks > 0:
+            self._fragments.append(self.separator)
+            self._pending += len(self.separator)
+
+        self._fragments.append(text)
+        self._pending += len(text)
+        self.blocks += 1
+
+        if self._pending >= self.buffer_size:
+            self.flush()
+
+    def paragraph(self, text):
+        self.write(text)
+
+    def table(self, rows):
+        """Write a table given as its Markdown rows."""
+        self.write("\n".join(rows))
+
+    def flush(self):
+        if len(self._fragments) > 0:
+            self.output.write("".join(self._fragments))
+            self._fragments.clear()
+            self._pending = 0
+
+        flush = getattr(self.output, "flush", None)
+
+        if flush is not None:
+            flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
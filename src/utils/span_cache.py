@@ -0,0 +1,120 @@
+from bisect import bisect_left, bisect_right
+
+import fitz
+
+
+class SpanCache:
+    """The text of one page, extracted once and queried many times.
+
+    The page is extracted with `get_text("dict", sort=True)` on creation.
+    Header statistics read `spans()`, table detection reads `line_bboxes()`,
+    and every text rectangle between tables is served by `clip()` from an
+    index of the lines by their vertical center, rather than by extracting
+    the page again with `clip=`.
+    """
+
+    def __init__(self, page, flags=fitz.TEXTFLAGS_TEXT):
+        self.page = page
+        self.blocks = page.get_text("dict", flags=flags, sort=True)["blocks"]
+
+        lines = sorted(
+            ((line["bbox"][1] + line["bbox"][3]) / 2, block_index, line_index)
+            for block_index, block in enumerate(self.blocks)
+            for line_index, line in enumerate(block["lines"])
+        )
+        self._centers = [center_y for center_y, _, _ in lines]
+        self._lines = [
+            (block_index, line_index) for _, block_index, line_index in lines
+        ]
+        # how far a line intersecting a rect may have its center outside it
+        self._max_half_height = max(
+            (
+                (line["bbox"][3] - line["bbox"][1]) / 2
+                for block in self.blocks
+                for line in block["lines"]
+            ),
+            default=0.0,
+        )
+
+    def spans(self):
+        return (s for b in self.blocks for l in b["lines"] for s in l["spans"])
+
+    def line_bboxes(self):
+        """Return the bboxes of the horizontal lines, as `tables.page_line_bboxes`."""
+        return [
+            l["bbox"] for b in self.blocks for l in b["lines"] if l["dir"] == (1.0, 0.0)
+        ]
+
+    def clip(self, rect, exclude=()) -> list:
+        """Return the blocks of the lines with their center inside `rect`.
+
+        Unlike `get_text(clip=rect)`, which keeps the characters inside
+        `rect`, whole lines are kept or dropped. A line crossing the edge of
+        `rect` with its center outside is kept too, unless it lies inside one
+        of the `exclude` rects, the tables of the page. Blocks that lose lines get the bbox
+        of the lines they keep, and blocks are ordered as `sort=True` orders
+        them.
+        """
+        rect = fitz.Rect(rect)
+        exclude = [fitz.Rect(r) for r in exclude]
+        start = bisect_left(self._centers, rect.y0 - self._max_half_height)
+        stop = bisect_right(self._centers, rect.y1 + self._max_half_height)
+
+        kept = {}
+
+        for block_index, line_index in self._lines[start:stop]:
+            bbox = fitz.Rect(self.blocks[block_index]["lines"][line_index]["bbox"])
+
+            if not bbox.intersects(rect):
+                continue
+
+            # a line crossing the edge of `rect` is kept unless a table has it
+            if not rect.y0 <= (bbox.y0 + bbox.y1) / 2 <= rect.y1 or not (
+                rect.x0 <= (bbox.x0 + bbox.x1) / 2 <= rect.x1
+            ):
+                if any(bbox in r for r in exclude):
+                    continue
+
+            kept.setdefault(block_index, []).append(line_index)
+
+        blocks = []
+
+        for block_index, line_indexes in kept.items():
+            block = self.blocks[block_index]
+
+            if len(line_indexes) < len(block["lines"]):
+                lines = [block["lines"][i] for i in sorted(line_indexes)]
+                bbox = fitz.Rect(lines[0]["bbox"])
+
+                for line in lines[1:]:
+                    bbox |= line["bbox"]
+
+                block = dict(block, lines=lines, bbox=tuple(bbox))
+
+            blocks.append(block)
+
+        blocks.sort(key=lambda b: (b["bbox"][3], b["bbox"][0]))
+
+        return blocks
+
+
+class RawDictTextPage:
+    """A `fitz.TextPage` that extracts its "rawdict" only once.
+
+    `Table.to_markdown` extracts the whole text page as a rawdict for every
+    cell of the table. Setting a table's `textpage` to this wrapper serves all
+    cells of all tables on the page from one extraction.
+    """
+
+    def __init__(self, textpage):
+        self.textpage = textpage
+        self._rawdict = None
+
+    def extractRAWDICT(self, *args, **kwargs):
+        if self._rawdict is None:
+            self._rawdict = self.textpage.extractRAWDICT(*args, **kwargs)
+
+        return self._rawdict
+
+    def __getattr__(self, name):
+        return getattr(self.textpage, name)
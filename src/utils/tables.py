@@ -0,0 +1,147 @@
+import fitz
+
+
+def count_ruling_edges(page, limit=None) -> int:
+    """Count the drawn rectangles and horizontal or vertical lines on `page`.
+
+    These are what `find_tables` builds cell borders from. Counting stops at
+    `limit`, as callers only need to know whether there are enough.
+    """
+    edges = 0
+
+    for path in page.get_cdrawings():
+        for item in path["items"]:
+            kind = item[0]
+
+            if kind == "l":
+                (x0, y0), (x1, y1) = item[1], item[2]
+
+                if abs(y0 - y1) < 1 or abs(x0 - x1) < 1:
+                    edges += 1
+            elif kind in ("re", "qu"):
+                edges += 1
+
+        if limit is not None and edges >= limit:
+            break
+
+    return edges
+
+
+def count_aligned_rows(line_bboxes, tolerance=2) -> int:
+    """Count the rows with more than one text line sharing a baseline.
+
+    Cells of a table row are separate lines at the same height, whereas a
+    line of prose is usually alone at its height.
+    """
+    bottoms = sorted(bbox[3] for bbox in line_bboxes)
+    rows = 0
+    i = 0
+
+    while i < len(bottoms):
+        j = i
+
+        while j + 1 < len(bottoms) and bottoms[j + 1] - bottoms[i] <= tolerance:
+            j += 1
+
+        if j > i:
+            rows += 1
+
+        i = j + 1
+
+    return rows
+
+
+def page_line_bboxes(page):
+    blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]
+
+    return [l["bbox"] for b in blocks for l in b["lines"] if l["dir"] == (1.0, 0.0)]
+
+
+def is_table_candidate(
+    page, line_bboxes=None, min_edges=20, min_aligned_rows=3
+) -> bool:
+    """Cheaply guess whether `find_tables` would find a table on `page`.
+
+    A page needs enough ruling edges for `find_tables` to build cells from,
+    and enough rows of side by side text to be a table rather than a figure.
+    `line_bboxes` are the bboxes of the page's horizontal text lines, which
+    callers that already extracted the page can pass to save extracting again.
+    """
+    if count_ruling_edges(page, limit=min_edges) < min_edges:
+        return False
+
+    if line_bboxes is None:
+        line_bboxes = page_line_bboxes(page)
+
+    return count_aligned_rows(line_bboxes) >= min_aligned_rows
+
+
+def find_tables(page, line_bboxes=None, **kwargs) -> list:
+    """Return the tables on `page`, only running `find_tables` on candidate pages."""
+    if not is_table_candidate(page, line_bboxes=line_bboxes, **kwargs):
+        return []
+
+    return page.find_tables().tables
+
+
+def filled_share(rows) -> float:
+    """Return the share of (unspanned) cells with text in `Table.extract()` rows.
+
+    Charts drawn with gridlines come out of `find_tables` as mostly empty
+    tables, so a low share means a figure rather than a table.
+    """
+    cells = [cell for row in rows for cell in row if cell is not None]
+
+    if len(cells) == 0:
+        return 0.0
+
+    return sum([1 for cell in cells if cell.strip()]) / len(cells)
+
+
+def table_to_markdown(table, rows=None) -> str:
+    """Write a `find_tables` table as a Markdown table.
+
+    Like `Table.to_markdown`, empty (spanned) cells take the text to their
+    left, then above. Cell text comes from the characters `find_tables`
+    already collected, rather than from extracting the page again per cell,
+    so there is no bold or italic markup. `rows` is `table.extract()` when
+    already known.
+    """
+    if rows is None:
+        rows = table.extract()
+
+    rows = [list(row) for row in rows]
+
+    for row in rows:
+        for i in range(1, len(row)):
+            if row[i] is None:
+                row[i] = row[i - 1]
+
+    for previous_row, row in zip(rows, rows[1:]):
+        for i, cell in enumerate(row):
+            if cell is None:
+                row[i] = previous_row[i]
+
+    header = [name or f"Col{i + 1}" for i, name in enumerate(table.header.names)]
+
+    # the header is the first row unless it sits above the table
+    return rows_to_markdown(header, rows[0 if table.header.external else 1 :])
+
+
+def rows_to_markdown(header, rows) -> str:
+    """Write a header and rows of cell text (or None) as a Markdown table.
+
+    Pipes in cells are escaped and line breaks become `<br>`.
+    """
+
+    def format_row(cells):
+        cells = [
+            (cell or "").replace("|", "\\|").replace("\n", "<br>") for cell in cells
+        ]
+
+        return "|" + "|".join(cells) + "|"
+
+    lines = [format_row(header), "|" + "|".join(["---"] * len(header)) + "|"]
+    lines += [format_row(row) for row in rows]
+
+    return "\n".join(lines)
@@ -1,20 +1,51 @@
 import re
+from functools import lru_cache
 
+re_num_currency_percent = r"^[-$]?['`,.\d ]*[?%]?$"
+re_one_or_two_short_words = r"^\w{,3}( \w{,3})?$"
+re_date = r"^[(]?[12]\d{,3}[)]?$"
 
-def should_skip(text: str) -> bool:
-    if len(text) == 0:
-        return True
+DEFAULT_RULES = (re_num_currency_percent, re_one_or_two_short_words, re_date)
+
+
+class TextSkipper:
+    """Decide whether extracted text is noise, e.g. numbers, dates or fragments.
+
+    The rules are compiled into one alternation, and results for short strings
+    are memoized in a bounded LRU because headers, footers and page numbers
+    repeat on every page.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, cache_size=8192, max_cached_length=256):
+        self.rules = tuple(rules)
+        self.pattern = re.compile("|".join([f"(?:{rule})" for rule in self.rules]))
+        self.max_cached_length = max_cached_length
+        self._cached_should_skip = lru_cache(maxsize=cache_size)(self._should_skip)
+
+    def should_skip(self, text: str) -> bool:
+        if len(text) > self.max_cached_length:
+            return self._should_skip(text)
+
+        return self._cached_should_skip(text)
 
-    re_num_currency_percent = r"^[-$]?['`,.\d ]*[?%]?$"
-    if re.findall(re_num_currency_percent, text):
-        return True
+    def _should_skip(self, text: str) -> bool:
+        if len(text) == 0:
+            return True
 
-    re_one_or_two_short_words = r"^\w{,3}( \w{,3})?$"
-    if re.findall(re_one_or_two_short_words, text):
-        return True
+        return self.pattern.search(text) is not None
+
+    def should_skip_many(self, texts) -> list[bool]:
+        should_skip = self.should_skip
+
+        return [should_skip(text) for text in texts]
+
+
+default_skipper = TextSkipper()
+
+
+def should_skip(text: str) -> bool:
+    return default_skipper.should_skip(text)
 
-    re_date = r"^[(]?[12]\d{,3}[)]?$"
-    if re.findall(re_date, text):
-        return True
 
-    return False
+def should_skip_many(texts) -> list[bool]:
+    return default_skipper.should_skip_many(texts)